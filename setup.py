@@ -16,6 +16,12 @@ setup(name='tap-square',
           'methodtools==0.4.2',
       ],
       extras_require={
+          'async': [
+              'aiohttp',
+          ],
+          'fast': [
+              'orjson',
+          ],
           'dev': [
               'ipdb',
               'pylint==2.5.3',
@@ -30,6 +36,9 @@ setup(name='tap-square',
           'tap_square/schemas': [
               'items.json'
           ],
+          'tap_square': [
+              'catalog_cache.json'
+          ],
       },
       include_package_data=True,
 )
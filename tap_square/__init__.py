@@ -4,7 +4,6 @@ import json
 import singer
 from singer.catalog import write_catalog
 from tap_square.discover import discover
-from tap_square.sync import sync
 
 LOGGER = singer.get_logger()
 
@@ -20,6 +19,8 @@ def main():
     if args.discover:
         write_catalog(catalog)
     else:
+        # Imported here so discovery doesn't pay for loading the Square SDK
+        from tap_square.sync import sync # pylint: disable=import-outside-toplevel
         sync(args.config, args.config_path, args.state, catalog)
 
 if __name__ == '__main__':
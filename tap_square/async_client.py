@@ -0,0 +1,238 @@
+import asyncio
+import inspect
+import threading
+
+import singer
+from singer import utils
+
+try:
+    import aiohttp
+except ImportError: # pragma: no cover
+    aiohttp = None
+
+from .client import (
+    RetryableError,
+    build_catalog_search_body,
+    build_customers_body,
+    build_inventories_body,
+    build_orders_body,
+    build_refunds_params,
+    build_shifts_body,
+    build_team_members_body,
+    is_retryable_response,
+    retry_v2_request,
+)
+from .rate_limit import RATE_LIMITER, get_retry_after
+
+
+LOGGER = singer.get_logger()
+
+BASE_URLS = {
+    'production': 'https://connect.squareup.com',
+    'sandbox': 'https://connect.squareupsandbox.com',
+}
+# Matches the API version pinned by the squareup SDK the sync client uses
+SQUARE_VERSION = '2023-06-08'
+
+
+class AsyncSquareClient():
+    '''
+    An asyncio counterpart of `SquareClient` that talks to the Square REST API
+    through a pooled aiohttp session. The `get_*` methods are async generators
+    yielding the same `(page, cursor)` tuples as their `SquareClient` namesakes.
+    '''
+    def __init__(self, access_token, environment, max_connections=100):
+        if aiohttp is None:
+            raise RuntimeError("The async client backend requires aiohttp, install tap-square[async]")
+
+        self._access_token = access_token
+        self._base_url = BASE_URLS[environment]
+        self._max_connections = max_connections
+        self._session = None
+
+    def _get_session(self):
+        # The session binds to the running loop so it is created on first use
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers={
+                    'Authorization': 'Bearer {}'.format(self._access_token),
+                    'Content-Type': 'application/json',
+                    'Square-Version': SQUARE_VERSION,
+                },
+                connector=aiohttp.TCPConnector(limit=self._max_connections),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @retry_v2_request
+    async def _request(self, method, path, params=None, body=None):
+        wait = RATE_LIMITER.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        async with self._get_session().request(method, self._base_url + path, params=params, json=body) as response:
+            if response.status < 400:
+                RATE_LIMITER.on_success()
+                return await response.json()
+
+            LOGGER.info("HTTP status code when it errors out: %s", response.status)
+            if response.status == 429:
+                RATE_LIMITER.on_throttle(get_retry_after(response.headers))
+            text = await response.text()
+            try:
+                error_message = (await response.json()).get('errors') or text
+            except (aiohttp.ContentTypeError, ValueError):
+                error_message = text
+
+            if is_retryable_response(response.status, str(error_message)):
+                raise RetryableError(error_message)
+            raise RuntimeError(error_message)
+
+    async def _get_v2_objects(self, request_timer_suffix, method, path, body_key, body=None, params=None):
+        '''
+        Pages through a v2 endpoint, sending the cursor in the body for POST
+        searches and in the query string for GET lists
+        '''
+        body = dict(body) if body is not None else None
+        params = {key: value for key, value in (params or {}).items() if value is not None}
+        cursor = (body or params).get('cursor', '__initial__')
+        while cursor:
+            if cursor != '__initial__':
+                if body is not None:
+                    body['cursor'] = cursor
+                else:
+                    params['cursor'] = cursor
+
+            with singer.http_request_timer('GET ' + request_timer_suffix):
+                result = await self._request(method, path, params=params, body=body)
+
+            cursor = result.get('cursor')
+            yield (result.get(body_key, []), cursor)
+
+    async def get_catalog(self, object_type, start_time):
+        async for page in self.get_catalog_objects([object_type], start_time):
+            yield page
+
+    async def get_catalog_objects(self, object_types, start_time):
+        body = build_catalog_search_body(object_types, start_time)
+
+        async for page in self._get_v2_objects(','.join(object_types), 'POST', '/v2/catalog/search', 'objects', body=body):
+            yield page
+
+    async def get_locations(self):
+        async for page in self._get_v2_objects('locations', 'GET', '/v2/locations', 'locations'):
+            yield page
+
+    async def get_bank_accounts(self):
+        async for page in self._get_v2_objects('bank_accounts', 'GET', '/v2/bank-accounts', 'bank_accounts'):
+            yield page
+
+    async def get_customers(self, start_time, end_time):
+        body = build_customers_body(start_time, end_time)
+
+        async for page in self._get_v2_objects('customers', 'POST', '/v2/customers/search', 'customers', body=body):
+            yield page
+
+    async def get_orders(self, location_ids, start_time):
+        body = build_orders_body(location_ids, start_time)
+
+        async for page in self._get_v2_objects('orders', 'POST', '/v2/orders/search', 'orders', body=body):
+            yield page
+
+    async def get_team_members(self, location_ids):
+        body = build_team_members_body(location_ids)
+
+        async for page in self._get_v2_objects('team_members', 'POST', '/v2/team-members/search', 'team_members', body=body):
+            yield page
+
+    async def get_inventories(self, start_time, bookmarked_cursor, location_ids=None):
+        body = build_inventories_body(start_time, bookmarked_cursor, location_ids)
+
+        async for page in self._get_v2_objects('inventories', 'POST', '/v2/inventory/counts/batch-retrieve', 'counts', body=body):
+            yield page
+
+    async def get_shifts(self, bookmarked_cursor, sort_order='ASC'):
+        body = build_shifts_body(bookmarked_cursor, sort_order)
+
+        async for page in self._get_v2_objects('shifts', 'POST', '/v2/labor/shifts/search', 'shifts', body=body):
+            yield page
+
+    async def get_refunds(self, start_time, bookmarked_cursor, sort_order=None):
+        params = build_refunds_params(start_time, bookmarked_cursor, sort_order)
+
+        async for page in self._get_v2_objects('refunds', 'GET', '/v2/refunds', 'refunds', params=params):
+            yield page
+
+    async def _get_v2_location_objects(self, request_timer_suffix, path, body_key, location_id, start_time, bookmarked_cursor, limit, end_time=None):
+        params = {
+            'location_id': location_id,
+            'begin_time': start_time,
+            'end_time': end_time or utils.strftime(utils.now(), utils.DATETIME_PARSE),
+            'cursor': bookmarked_cursor,
+            'limit': limit,
+        }
+
+        async for page in self._get_v2_objects(request_timer_suffix, 'GET', path, body_key, params=params):
+            yield page
+
+    async def get_payments(self, location_id, start_time, bookmarked_cursor, end_time=None):
+        async for page in self._get_v2_location_objects(
+                'payments', '/v2/payments', 'payments', location_id, start_time, bookmarked_cursor, 100, end_time):
+            yield page
+
+    async def get_cash_drawer_shifts(self, location_id, start_time, bookmarked_cursor):
+        async for page in self._get_v2_location_objects(
+                'cash drawer shifts', '/v2/cash-drawers/shifts', 'items', location_id, start_time, bookmarked_cursor, 1000):
+            yield page
+
+    async def get_payouts(self, location_id, start_time, bookmarked_cursor):
+        async for page in self._get_v2_location_objects(
+                'payouts details', '/v2/payouts', 'payouts', location_id, start_time, bookmarked_cursor, 100):
+            yield page
+
+
+class AsyncClientAdapter():
+    '''
+    Exposes an `AsyncSquareClient` through the synchronous generator interface
+    the streams use. All requests run on one event loop in a background thread,
+    so pages requested from any number of threads share one connection pool.
+    Methods the async client doesn't implement fall through to `sync_client`.
+    '''
+    def __init__(self, async_client, sync_client):
+        self._async_client = async_client
+        self._sync_client = sync_client
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='square-async-client', daemon=True)
+        self._thread.start()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _iterate(self, async_pages):
+        try:
+            while True:
+                try:
+                    page = self._run(async_pages.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield page
+        finally:
+            self._run(async_pages.aclose())
+
+    def __getattr__(self, name):
+        method = getattr(self._async_client, name, None)
+        if not inspect.isasyncgenfunction(method):
+            return getattr(self._sync_client, name)
+
+        def iterate(*args, **kwargs):
+            return self._iterate(method(*args, **kwargs))
+        return iterate
+
+    def close(self):
+        self._run(self._async_client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,74 @@
+import json
+import tempfile
+import threading
+
+import singer
+from singer import utils
+
+
+LOGGER = singer.get_logger()
+
+# Records per page served back to each stream, which is how often it checkpoints
+SPOOL_PAGE_SIZE = 1000
+
+
+class SharedCatalogClient():
+    '''
+    Wraps a client so the catalog streams share a single catalog search.
+    `start_times` maps each selected catalog object type to its stream's
+    bookmark. The first `get_catalog` call searches every type at once from
+    the earliest bookmark and spools the objects to one temporary file per
+    type; each stream then reads back its own type, filtered to the objects
+    updated since its bookmark. Everything else goes to the wrapped client.
+    '''
+    def __init__(self, client, start_times):
+        self._client = client
+        self._start_times = start_times
+        self._lock = threading.Lock()
+        self._spools = None
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _search(self):
+        object_types = sorted(self._start_times)
+        start_time = min(self._start_times.values(), key=utils.strptime_to_utc)
+        LOGGER.info('Searching the catalog for %s from %s', object_types, start_time)
+
+        spools = {object_type: tempfile.TemporaryFile(mode='w+', encoding='utf-8') for object_type in object_types}
+        for page, _ in self._client.get_catalog_objects(object_types, start_time):
+            for record in page:
+                spool = spools.get(record['type'])
+                if spool is not None:
+                    spool.write(json.dumps(record) + '\n')
+        return spools
+
+    def get_catalog(self, object_type, start_time):
+        if object_type not in self._start_times:
+            yield from self._client.get_catalog(object_type, start_time)
+            return
+
+        with self._lock:
+            if self._spools is None:
+                self._spools = self._search()
+            spool = self._spools[object_type]
+
+        start_time = utils.strptime_to_utc(start_time)
+        spool.seek(0)
+        page = []
+        for line in spool:
+            record = json.loads(line)
+            # The shared search may begin before this stream's bookmark
+            if utils.strptime_to_utc(record['updated_at']) < start_time:
+                continue
+            page.append(record)
+            if len(page) == SPOOL_PAGE_SIZE:
+                yield (page, None)
+                page = []
+        if page:
+            yield (page, None)
+
+    def close(self):
+        for spool in (self._spools or {}).values():
+            spool.close()
+        self._client.close()
@@ -6,6 +6,8 @@ from square.client import Client
 from singer import utils
 import singer
 import backoff
+from .concurrency import prefetch
+from .rate_limit import RATE_LIMITER, DEFAULT_MAX_REQUESTS_PER_SECOND, get_retry_after
 
 
 LOGGER = singer.get_logger()
@@ -49,6 +51,15 @@ def write_config(config, config_path, data):
     return config
 
 
+def token_expires_soon(expires_at):
+    '''
+    Checks if a token expiring at `expires_at` is within the refresh window
+    '''
+    token_expiry_date = singer.utils.strptime_with_tz(expires_at)
+    now = utils.now()
+    return (token_expiry_date - now).days <= REFRESH_TOKEN_BEFORE
+
+
 def require_new_access_token(access_token, client):
     '''
     Checks if the access token needs to be refreshed
@@ -67,16 +78,139 @@ def require_new_access_token(access_token, client):
         LOGGER.error(error_message)
         return True
 
-    # Parse the token expiry date
-    token_expiry_date = singer.utils.strptime_with_tz(response.body['expires_at'])
-    now = utils.now()
-    return (token_expiry_date - now).days <= REFRESH_TOKEN_BEFORE
+    return token_expires_soon(response.body['expires_at'])
 
 
 class RetryableError(Exception):
     pass
 
 
+def is_retryable_response(status, error_message):
+    is_service_unavailable = 'Service Unavailable' in error_message
+    is_upstream_error = 'upstream connect error or disconnect/reset before headers' in error_message
+    is_cf_error_1101 = '<span class="cf-error-code">1101</span>' in error_message
+    is_html_error = isinstance(error_message, str) and error_message.startswith('<!DOCTYPE html>')
+    is_status_429_or_500 = status == 429 or status >= 500
+    return any({is_service_unavailable, is_upstream_error, is_cf_error_1101, is_html_error, is_status_429_or_500})
+
+
+# The retry policy for v2 requests, shared by the sync and async clients
+retry_v2_request = backoff.on_exception(
+    backoff.expo,
+    RetryableError,
+    max_time=180, # seconds
+    giveup=should_not_retry,
+    on_backoff=log_backoff,
+    jitter=backoff.full_jitter,
+)
+
+
+def get_exclusive_begin_time(start_time):
+    # Move the max_updated_at back the smallest unit possible
+    # because the begin_time query param is exclusive
+    start_time = utils.strptime_to_utc(start_time)
+    start_time = start_time - timedelta(milliseconds=1)
+    return utils.strftime(start_time)
+
+
+# Request bodies, shared by the sync and async clients
+
+def build_catalog_search_body(object_types, start_time):
+    return {
+        "object_types": object_types,
+        "include_deleted_objects": True,
+        "begin_time": get_exclusive_begin_time(start_time),
+    }
+
+
+def build_customers_body(start_time, end_time):
+    return {
+        "query": {
+            "filter": {
+                "updated_at": {
+                    "start_at": start_time, # Inclusive on start_at
+                    'end_at': end_time      # Exclusive on end_at
+                }
+            },
+            'sort': {
+                'field': 'CREATED_AT',
+                'order': 'ASC'
+            }
+        }
+    }
+
+
+def build_orders_body(location_ids, start_time):
+    return {
+        "query": {
+            "filter": {
+                "date_time_filter": {
+                    "updated_at": {
+                        "start_at": start_time
+                    }
+                }
+            },
+            "sort": {
+                "sort_field": "UPDATED_AT",
+                "sort_order": "ASC"
+            }
+        },
+        "location_ids": location_ids,
+    }
+
+
+def build_team_members_body(location_ids):
+    return {
+        "query": {
+            "filter": {
+                "location_ids": location_ids,
+                "status": "ACTIVE"
+            }
+        },
+        "limit": 200
+    }
+
+
+def build_inventories_body(start_time, bookmarked_cursor, location_ids=None):
+    body = {'updated_after': start_time}
+
+    if location_ids:
+        body['location_ids'] = location_ids
+
+    if bookmarked_cursor:
+        body['cursor'] = bookmarked_cursor
+
+    return body
+
+
+def build_shifts_body(bookmarked_cursor, sort_order):
+    body = {
+        "query": {
+            "sort": {
+                "field": "UPDATED_AT",
+                "order": sort_order
+            }
+        }
+    }
+
+    if bookmarked_cursor:
+        body['cursor'] = bookmarked_cursor
+
+    return body
+
+
+def build_refunds_params(start_time, bookmarked_cursor, sort_order=None):
+    params = {'begin_time': get_exclusive_begin_time(start_time)}
+
+    if sort_order:
+        params['sort_order'] = sort_order
+
+    if bookmarked_cursor:
+        params['cursor'] = bookmarked_cursor
+
+    return params
+
+
 class SquareClient():
     def __init__(self, config, config_path):
         self._refresh_token = config['refresh_token']
@@ -84,16 +218,40 @@ class SquareClient():
         self._client_secret = config['client_secret']
 
         self._environment = 'sandbox' if config.get('sandbox') == 'true' else 'production'
+        self._prefetch_pages = int(config.get('prefetch_pages', 0))
+        RATE_LIMITER.configure(float(config.get('max_requests_per_second', DEFAULT_MAX_REQUESTS_PER_SECOND)))
 
         self._access_token = self._get_access_token(config, config_path)
         self._client = Client(access_token=self._access_token, environment=self._environment)
 
+    @property
+    def access_token(self):
+        return self._access_token
+
+    @property
+    def environment(self):
+        return self._environment
+
+    def close(self):
+        # The SDK client holds no resources that need releasing
+        pass
+
     def _get_access_token(self, config, config_path):
         '''
         Retrieves the access token from the config file. If the access token is expired, it will refresh it.
         Otherwise, it will return the cached access token.
         '''
         access_token = config.get("access_token")
+        expires_at = config.get("access_token_expires_at")
+
+        # The expiry saved with the token lets us skip the token status round trip
+        if access_token and expires_at and not token_expires_soon(expires_at):
+            LOGGER.info('Using cached access token, it expires at %s', expires_at)
+            return access_token
+
+        if access_token:
+            LOGGER.info('No cached access token expiry outside the refresh window, checking token status')
+
         client = Client(environment=self._environment)
 
         # Check if the access token needs to be refreshed
@@ -120,43 +278,38 @@ class SquareClient():
                 {
                     'access_token': access_token,
                     'refresh_token': result.body['refresh_token'],
+                    'access_token_expires_at': result.body.get('expires_at'),
                 },
             )
 
         return access_token
 
     @staticmethod
-    @backoff.on_exception(
-        backoff.expo,
-        RetryableError,
-        max_time=180, # seconds
-        giveup=should_not_retry,
-        on_backoff=log_backoff,
-        jitter=backoff.full_jitter,
-    )
+    @retry_v2_request
     def _retryable_v2_method(request_method, body, **kwargs):
+        RATE_LIMITER.acquire()
         result = request_method(body, **kwargs)
 
         if result.is_error():
             LOGGER.info("HTTP status code when it errors out: %s", result.status_code)
+            if result.status_code == 429:
+                RATE_LIMITER.on_throttle(get_retry_after(result.headers))
             error_message = result.errors if result.errors else result.body
 
-            # Refactor the conditions into separate variables for readability
-            is_service_unavailable = 'Service Unavailable' in error_message
-            is_upstream_error = 'upstream connect error or disconnect/reset before headers' in error_message
-            is_cf_error_1101 = '<span class="cf-error-code">1101</span>' in error_message
-            is_html_error = isinstance(error_message, str) and error_message.startswith('<!DOCTYPE html>')
-            is_status_429_or_500 = result.status_code == 429 or result.status_code >= 500
-
-            retryable_conditions = {is_service_unavailable, is_upstream_error, is_cf_error_1101, is_html_error, is_status_429_or_500}
-            if any(retryable_conditions):
+            if is_retryable_response(result.status_code, error_message):
                 raise RetryableError(error_message)
             else:
                 raise RuntimeError(error_message)
 
+        RATE_LIMITER.on_success()
         return result
 
     def _get_v2_objects(self, request_timer_suffix, request_method, body, body_key):
+        yield from prefetch(
+            self._iter_v2_objects(request_timer_suffix, request_method, body, body_key),
+            self._prefetch_pages)
+
+    def _iter_v2_objects(self, request_timer_suffix, request_method, body, body_key):
         cursor = body.get('cursor', '__initial__')
         while cursor:
             if cursor != '__initial__':
@@ -168,27 +321,65 @@ class SquareClient():
             cursor = result.body.get('cursor')
             yield (result.body.get(body_key, []), cursor)
 
+    def _get_v2_location_objects(self, request_timer_suffix, request_method, bookmarked_cursor, body_key):
+        yield from prefetch(
+            self._iter_v2_location_objects(request_timer_suffix, request_method, bookmarked_cursor, body_key),
+            self._prefetch_pages)
 
-    def get_catalog(self, object_type, start_time):
-        # Move the max_updated_at back the smallest unit possible
-        # because the begin_time query param is exclusive
-        start_time = utils.strptime_to_utc(start_time)
-        start_time = start_time - timedelta(milliseconds=1)
-        start_time = utils.strftime(start_time)
+    def _iter_v2_location_objects(self, request_timer_suffix, request_method, bookmarked_cursor, body_key):
+        '''
+        Pages through the v2 list endpoints that take one location and a `cursor` keyword
+        '''
+        if bookmarked_cursor:
+            cursor = bookmarked_cursor
+        else:
+            cursor = '__initial__' # initial value so while loop is always entered one time
 
-        body = {
-            "object_types": [object_type],
-            "include_deleted_objects": True,
-        }
+        while cursor:
+            if cursor == '__initial__':
+                # Initial text was needed to go into the while loop, but api needs
+                # it to be a valid bookmarked cursor or None
+                cursor = bookmarked_cursor
 
-        body['begin_time'] = start_time
+            with singer.http_request_timer('GET ' + request_timer_suffix):
+                result = self._retryable_v2_method(
+                    lambda bdy, cursor=cursor: request_method(cursor),
+                    None,
+                )
+
+            yield (result.body.get(body_key, []), result.body.get('cursor'))
+
+            cursor = result.body.get('cursor')
+
+
+    def get_catalog(self, object_type, start_time):
+        yield from self.get_catalog_objects([object_type], start_time)
+
+    def get_catalog_objects(self, object_types, start_time):
+        body = build_catalog_search_body(object_types, start_time)
 
         yield from self._get_v2_objects(
-            object_type,
+            ','.join(object_types),
             lambda bdy: self._client.catalog.search_catalog_objects(body=bdy),
             body,
             'objects')
 
+    def get_catalog_latest_time(self):
+        '''
+        Returns when the catalog was last changed, using a search that matches no objects
+        '''
+        body = {
+            "begin_time": utils.strftime(utils.now()),
+            "limit": 1,
+        }
+
+        with singer.http_request_timer('GET catalog latest time'):
+            result = self._retryable_v2_method(
+                lambda bdy: self._client.catalog.search_catalog_objects(body=bdy),
+                body)
+
+        return result.body.get('latest_time')
+
     def get_locations(self):
         body = {}
 
@@ -208,20 +399,7 @@ class SquareClient():
             'bank_accounts')
 
     def get_customers(self, start_time, end_time):
-        body = {
-            "query": {
-                "filter": {
-                    "updated_at": {
-                        "start_at": start_time, # Inclusive on start_at
-                        'end_at': end_time      # Exclusive on end_at
-                    }
-                },
-                'sort': {
-                    'field': 'CREATED_AT',
-                    'order': 'ASC'
-                }
-            }
-        }
+        body = build_customers_body(start_time, end_time)
 
         yield from self._get_v2_objects(
             'customers',
@@ -230,23 +408,7 @@ class SquareClient():
             'customers')
 
     def get_orders(self, location_ids, start_time):
-        body = {
-            "query": {
-                "filter": {
-                    "date_time_filter": {
-                        "updated_at": {
-                            "start_at": start_time
-                        }
-                    }
-                },
-                "sort": {
-                    "sort_field": "UPDATED_AT",
-                    "sort_order": "ASC"
-                }
-            }
-        }
-
-        body['location_ids'] = location_ids
+        body = build_orders_body(location_ids, start_time)
 
         yield from self._get_v2_objects(
             'orders',
@@ -254,27 +416,39 @@ class SquareClient():
             body,
             'orders')
 
+    def get_order_entries(self, location_ids, start_time):
+        '''
+        Like `get_orders` but yields pages of order entries, only the id, version and location of each order
+        '''
+        body = dict(build_orders_body(location_ids, start_time), return_entries=True)
+
+        yield from self._get_v2_objects(
+            'order entries',
+            lambda bdy: self._client.orders.search_orders(body=bdy),
+            body,
+            'order_entries')
+
+    def batch_retrieve_orders(self, order_ids):
+        body = {'order_ids': order_ids}
+
+        with singer.http_request_timer('GET orders batch'):
+            result = self._retryable_v2_method(
+                lambda bdy: self._client.orders.batch_retrieve_orders(body=bdy),
+                body)
+
+        return result.body.get('orders', [])
+
     def get_team_members(self, location_ids):
-        body = {
-            "query": {
-                "filter": {
-                    "location_ids": location_ids,
-                    "status": "ACTIVE"
-                }
-            },
-            "limit": 200
-        }
+        body = build_team_members_body(location_ids)
+
         yield from self._get_v2_objects(
             'team_members',
             lambda bdy: self._client.team.search_team_members(body=bdy),
             body,
             'team_members')
 
-    def get_inventories(self, start_time, bookmarked_cursor):
-        body = {'updated_after': start_time}
-
-        if bookmarked_cursor:
-            body['cursor'] = bookmarked_cursor
+    def get_inventories(self, start_time, bookmarked_cursor, location_ids=None):
+        body = build_inventories_body(start_time, bookmarked_cursor, location_ids)
 
         yield from self._get_v2_objects(
             'inventories',
@@ -282,18 +456,8 @@ class SquareClient():
             body,
             'counts')
 
-    def get_shifts(self, bookmarked_cursor):
-        body = {
-            "query": {
-                "sort": {
-                    "field": "UPDATED_AT",
-                    "order": "ASC"
-                }
-            }
-        }
-
-        if bookmarked_cursor:
-            body['cursor'] = bookmarked_cursor
+    def get_shifts(self, bookmarked_cursor, sort_order='ASC'):
+        body = build_shifts_body(bookmarked_cursor, sort_order)
 
         yield from self._get_v2_objects(
             'shifts',
@@ -301,17 +465,8 @@ class SquareClient():
             body,
             'shifts')
 
-    def get_refunds(self, start_time, bookmarked_cursor):
-        start_time = utils.strptime_to_utc(start_time)
-        start_time = start_time - timedelta(milliseconds=1)
-        start_time = utils.strftime(start_time)
-
-        body = {
-        }
-        body['begin_time'] = start_time
-
-        if bookmarked_cursor:
-            body['cursor'] = bookmarked_cursor
+    def get_refunds(self, start_time, bookmarked_cursor, sort_order=None):
+        body = build_refunds_params(start_time, bookmarked_cursor, sort_order)
 
         yield from self._get_v2_objects(
             'refunds',
@@ -319,63 +474,35 @@ class SquareClient():
             body,
             'refunds')
 
-    def get_payments(self, location_id, start_time, bookmarked_cursor):
-        if bookmarked_cursor:
-            cursor = bookmarked_cursor
-        else:
-            cursor = '__initial__' # initial value so while loop is always entered one time
-
-        end_time = utils.strftime(utils.now(), utils.DATETIME_PARSE)
-        while cursor:
-            if cursor == '__initial__':
-                # Initial text was needed to go into the while loop, but api needs
-                # it to be a valid bookmarked cursor or None
-                cursor = bookmarked_cursor
-
-            with singer.http_request_timer('GET payments'):
-                result = self._retryable_v2_method(
-                    lambda bdy: self._client.payments.list_payments(
-                        location_id=location_id,
-                        begin_time=start_time,
-                        end_time=end_time,
-                        cursor=cursor,
-                        limit=100,
-                    ),
-                    None,
-                )
-
-            yield (result.body.get('payments', []), result.body.get('cursor'))
-
-            cursor = result.body.get('cursor')
+    def get_payments(self, location_id, start_time, bookmarked_cursor, end_time=None):
+        end_time = end_time or utils.strftime(utils.now(), utils.DATETIME_PARSE)
+
+        yield from self._get_v2_location_objects(
+            'payments',
+            lambda cursor: self._client.payments.list_payments(
+                location_id=location_id,
+                begin_time=start_time,
+                end_time=end_time,
+                cursor=cursor,
+                limit=100,
+            ),
+            bookmarked_cursor,
+            'payments')
 
     def get_cash_drawer_shifts(self, location_id, start_time, bookmarked_cursor):
-        if bookmarked_cursor:
-            cursor = bookmarked_cursor
-        else:
-            cursor = '__initial__' # initial value so while loop is always entered one time
-
         end_time = utils.strftime(utils.now(), utils.DATETIME_PARSE)
-        while cursor:
-            if cursor == '__initial__':
-                # initial text was needed to go into the while loop, but api needs
-                # it to be a valid bookmarked cursor or None
-                cursor = bookmarked_cursor
-
-            with singer.http_request_timer('GET cash drawer shifts'):
-                result = self._retryable_v2_method(
-                    lambda bdy: self._client.cash_drawers.list_cash_drawer_shifts(
-                        location_id=location_id,
-                        begin_time=start_time,
-                        end_time=end_time,
-                        cursor=cursor,
-                        limit=1000,
-                    ),
-                    None,
-                )
 
-            yield (result.body.get('items', []), result.body.get('cursor'))
-
-            cursor = result.body.get('cursor')
+        yield from self._get_v2_location_objects(
+            'cash drawer shifts',
+            lambda cursor: self._client.cash_drawers.list_cash_drawer_shifts(
+                location_id=location_id,
+                begin_time=start_time,
+                end_time=end_time,
+                cursor=cursor,
+                limit=1000,
+            ),
+            bookmarked_cursor,
+            'items')
 
     def _get_v1_objects(self, url, params, request_timer_suffix, bookmarked_cursor):
         headers = {
@@ -412,37 +539,27 @@ class SquareClient():
         jitter=backoff.full_jitter,
     )
     def _retryable_v1_method(session, url, params):
+        RATE_LIMITER.acquire()
         result = session.get(url, params=params)
+        if result.status_code == 429:
+            RATE_LIMITER.on_throttle(get_retry_after(result.headers))
         result.raise_for_status()
 
+        RATE_LIMITER.on_success()
         return result
 
 
     def get_payouts(self, location_id, start_time, bookmarked_cursor):
-        if bookmarked_cursor:
-            cursor = bookmarked_cursor
-        else:
-            cursor = '__initial__' # initial value so while loop is always entered one time
-
         end_time = utils.strftime(utils.now(), utils.DATETIME_PARSE)
-        while cursor:
-            if cursor == '__initial__':
-                # initial text was needed to go into the while loop, but api needs
-                # it to be a valid bookmarked cursor or None
-                cursor = bookmarked_cursor
 
-            with singer.http_request_timer('GET payouts details'):
-                result = self._retryable_v2_method(
-                    lambda bdy: self._client.payouts.list_payouts(
-                        location_id=location_id,
-                        begin_time=start_time,
-                        end_time=end_time,
-                        cursor=cursor,
-                        limit=100,
-                    ),
-                    None,
-                )
-
-            yield (result.body.get('payouts', []), result.body.get('cursor'))
-
-            cursor = result.body.get('cursor')
+        yield from self._get_v2_location_objects(
+            'payouts details',
+            lambda cursor: self._client.payouts.list_payouts(
+                location_id=location_id,
+                begin_time=start_time,
+                end_time=end_time,
+                cursor=cursor,
+                limit=100,
+            ),
+            bookmarked_cursor,
+            'payouts')
@@ -0,0 +1,105 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+_DONE = object()
+
+
+def _put(pages, item, cancelled):
+    '''
+    Blocks until `item` is queued, giving up once the consumer has gone away
+    '''
+    while not cancelled.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _run_task(task, pages, cancelled):
+    '''
+    Iterates a single task's pages into its queue, stopping early if the consumer has gone away
+    '''
+    try:
+        for page in task():
+            if not _put(pages, page, cancelled):
+                return
+        _put(pages, _DONE, cancelled)
+    except Exception as ex: # pylint: disable=broad-except
+        _put(pages, ex, cancelled)
+
+
+def ordered_parallel_pages(tasks, max_workers, queue_depth=2):
+    '''
+    Runs `tasks`, an iterable of `(key, task)` pairs where each task is a zero
+    argument callable returning an iterable of pages, on up to `max_workers`
+    threads and yields `(key, page)` in the order the tasks were given.
+
+    Each running task buffers at most `queue_depth` pages ahead of the
+    consumer, so memory stays bounded no matter how far ahead workers get.
+    With `max_workers` of 1 or less the tasks are run serially in the caller's
+    thread.
+    '''
+    if max_workers <= 1:
+        for key, task in tasks:
+            for page in task():
+                yield key, page
+        return
+
+    tasks = iter(tasks)
+    cancelled = threading.Event()
+    running = []
+
+    def submit_next(executor):
+        for key, task in tasks:
+            pages = queue.Queue(maxsize=queue_depth)
+            executor.submit(_run_task, task, pages, cancelled)
+            running.append((key, pages))
+            return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for _ in range(max_workers):
+                submit_next(executor)
+
+            while running:
+                key, pages = running.pop(0)
+                while True:
+                    page = pages.get()
+                    if page is _DONE:
+                        break
+                    if isinstance(page, Exception):
+                        raise page
+                    yield key, page
+                submit_next(executor)
+        finally:
+            cancelled.set()
+
+
+def prefetch(pages, depth):
+    '''
+    Iterates `pages` on a background thread, keeping up to `depth` pages
+    fetched ahead of the consumer so the next request is in flight while the
+    current page is processed. A depth of 0 iterates in the caller's thread.
+    '''
+    if depth <= 0:
+        yield from pages
+        return
+
+    queued = queue.Queue(maxsize=depth)
+    cancelled = threading.Event()
+    thread = threading.Thread(target=_run_task, args=(lambda: pages, queued, cancelled), daemon=True)
+    thread.start()
+    try:
+        while True:
+            page = queued.get()
+            if page is _DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        cancelled.set()
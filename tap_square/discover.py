@@ -1,15 +1,22 @@
+import hashlib
 import json
 import os
+import singer
 from singer import metadata
 from singer.catalog import Catalog
 from .streams import STREAMS
 
+LOGGER = singer.get_logger()
+
 def get_abs_path(path):
     return os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
 
 # NB: These streams cannot be queried using Sandbox OAuth credentials
 PRODUCTION_ONLY_STREAMS = {'bank_accounts', 'payouts'}
 
+# Both catalog variants, pre-serialized by `write_catalog_cache` and shipped with the package
+CATALOG_CACHE_PATH = get_abs_path('catalog_cache.json')
+
 def get_schemas(sandbox):
 
     schemas = {}
@@ -44,7 +51,26 @@ def get_schemas(sandbox):
     return schemas, schemas_metadata
 
 
-def discover(sandbox):
+def get_catalog_hash():
+    '''
+    Hashes everything discovery output depends on, so a stale catalog cache can be detected
+    '''
+    digest = hashlib.sha256()
+    digest.update(json.dumps(sorted(PRODUCTION_ONLY_STREAMS)).encode('utf-8'))
+    for stream_name, stream_object in sorted(STREAMS.items()):
+        digest.update(json.dumps([
+            stream_name,
+            stream_object.key_properties,
+            stream_object.replication_method,
+            stream_object.valid_replication_keys,
+            stream_object.replication_key,
+        ]).encode('utf-8'))
+        with open(get_abs_path('schemas/{}.json'.format(stream_name)), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def build_catalog(sandbox):
 
     schemas, schemas_metadata = get_schemas(sandbox)
     streams = []
@@ -61,4 +87,41 @@ def discover(sandbox):
 
         streams.append(catalog_entry)
 
-    return Catalog.from_dict({'streams': streams})
+    return {'streams': streams}
+
+
+def write_catalog_cache(path=CATALOG_CACHE_PATH):
+    cache = {
+        'hash': get_catalog_hash(),
+        'sandbox': build_catalog(True),
+        'production': build_catalog(False),
+    }
+    with open(path, 'w') as file:
+        json.dump(cache, file, indent=2)
+        file.write('\n')
+
+
+def load_catalog_cache(sandbox, path=CATALOG_CACHE_PATH):
+    '''
+    Returns the cached catalog for the environment, or None if there is no cache or it is stale
+    '''
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if cache.get('hash') != get_catalog_hash():
+        LOGGER.info('Catalog cache is out of date with the schemas, discovering from the schemas')
+        return None
+
+    return cache['sandbox' if sandbox else 'production']
+
+
+def discover(sandbox):
+    catalog = load_catalog_cache(sandbox)
+
+    if catalog is None:
+        catalog = build_catalog(sandbox)
+
+    return Catalog.from_dict(catalog)
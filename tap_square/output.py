@@ -0,0 +1,176 @@
+import copy
+import sys
+import threading
+import time
+
+import singer
+
+try:
+    import orjson
+except ImportError: # pragma: no cover
+    orjson = None
+
+
+def serialize_message(message):
+    '''
+    Serializes a Singer message to a JSON line, with orjson when it is installed.
+    orjson can't encode everything singer can (e.g. Decimal), so those fall back to singer.
+    '''
+    if orjson is not None:
+        try:
+            # orjson is a compiled extension that pylint can't see the members of
+            return orjson.dumps(message.asdict(), option=orjson.OPT_APPEND_NEWLINE) # pylint: disable=no-member
+        except TypeError:
+            pass
+    return (singer.format_message(message) + '\n').encode('utf-8')
+
+
+class Output:
+    '''
+    Writes Singer messages to stdout. Each message is written whole under a
+    lock, so one Output can be shared by streams syncing on different threads.
+
+    With a `buffer_size` messages are collected into writes of about that many
+    bytes, also flushed every `flush_interval` seconds. Buffered messages are
+    always flushed along with a STATE message so no state is emitted ahead of
+    the records it covers.
+    '''
+    def __init__(self, buffer_size=0, flush_interval=1.0):
+        self.lock = threading.RLock()
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._flushed_at = time.monotonic()
+
+    def write_message(self, message):
+        line = serialize_message(message)
+        with self.lock:
+            self._buffer.append(line)
+            self._buffered_bytes += len(line)
+            if isinstance(message, singer.StateMessage) \
+               or self._buffered_bytes >= self.buffer_size \
+               or time.monotonic() - self._flushed_at >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self._buffer:
+                data = b''.join(self._buffer)
+                self._buffer = []
+                self._buffered_bytes = 0
+                # stdout is looked up on each flush so redirecting it keeps working
+                if hasattr(sys.stdout, 'buffer'):
+                    sys.stdout.flush()
+                    sys.stdout.buffer.write(data)
+                    sys.stdout.buffer.flush()
+                else:
+                    sys.stdout.write(data.decode('utf-8'))
+                    sys.stdout.flush()
+            self._flushed_at = time.monotonic()
+
+    def write_schema(self, stream, schema, key_properties, bookmark_properties=None):
+        self.write_message(singer.SchemaMessage(
+            stream=stream,
+            schema=schema,
+            key_properties=key_properties,
+            bookmark_properties=bookmark_properties,
+        ))
+
+    def write_record(self, stream, record):
+        self.write_message(singer.RecordMessage(stream=stream, record=record))
+
+    def write_state(self, state):
+        self.write_message(singer.StateMessage(value=state))
+
+
+class CheckpointPolicy:
+    '''
+    Decides when a stream's checkpoints are written: every time with neither
+    limit set, otherwise once `records` records or `seconds` seconds have
+    passed since the last STATE.
+    '''
+    def __init__(self, records=0, seconds=0):
+        self.records = records
+        self.seconds = seconds
+        self._records_since_state = 0
+        self._state_written_at = time.monotonic()
+
+    def record_written(self):
+        self._records_since_state += 1
+
+    def state_written(self):
+        self._records_since_state = 0
+        self._state_written_at = time.monotonic()
+
+    def is_state_due(self):
+        if not self.records and not self.seconds:
+            return True
+        return bool((self.records and self._records_since_state >= self.records)
+                    or (self.seconds and time.monotonic() - self._state_written_at >= self.seconds))
+
+
+class StreamOutput:
+    '''
+    The output handle a single stream writes through. It also decides when the
+    stream's checkpoints are emitted: with no policy every checkpoint is
+    written, otherwise once `checkpoint_records` records or
+    `checkpoint_seconds` seconds have passed since the last STATE. The latest
+    checkpoint is kept until then, and `write_pending_state` writes it out when
+    a stream fails.
+
+    When `run_state` is given the stream is syncing alongside others with its
+    own copy of the state, and every state it writes has its bookmarks merged
+    into `run_state`, which is what actually gets emitted.
+    '''
+    def __init__(self, output, tap_stream_id, run_state=None, checkpoint_records=0, checkpoint_seconds=0):
+        self.output = output
+        self.tap_stream_id = tap_stream_id
+        self.run_state = run_state
+        self.checkpoint_policy = CheckpointPolicy(checkpoint_records, checkpoint_seconds)
+        self._pending_state = None
+
+    def write_schema(self, schema, key_properties, bookmark_properties=None):
+        self.output.write_schema(self.tap_stream_id, schema, key_properties, bookmark_properties)
+
+    def write_record(self, record):
+        self.output.write_record(self.tap_stream_id, record)
+        self.checkpoint_policy.record_written()
+
+    def checkpoint(self, state):
+        '''
+        Marks `state` as covering every record written so far, writing it if the policy says it's time
+        '''
+        if self.checkpoint_policy.is_state_due():
+            self.write_state(state)
+        else:
+            # Streams keep updating the same state dict, so hold on to it as it is now
+            self._pending_state = copy.deepcopy(state)
+
+    def write_pending_state(self):
+        if self._pending_state is not None:
+            self.write_state(self._pending_state)
+
+    def write_state(self, state):
+        self._pending_state = None
+        self.checkpoint_policy.state_written()
+
+        if self.run_state is None:
+            self.output.write_state(state)
+            return
+
+        with self.output.lock:
+            merge_stream_bookmarks(self.run_state, state, self.tap_stream_id)
+            self.output.write_state(self.run_state)
+
+
+def merge_stream_bookmarks(run_state, stream_state, tap_stream_id):
+    '''
+    Copies `tap_stream_id`'s bookmarks from `stream_state` into `run_state`
+    '''
+    bookmarks = stream_state.get('bookmarks', {}).get(tap_stream_id)
+    if bookmarks is None:
+        run_state.get('bookmarks', {}).pop(tap_stream_id, None)
+    else:
+        run_state.setdefault('bookmarks', {})[tap_stream_id] = copy.deepcopy(bookmarks)
+    return run_state
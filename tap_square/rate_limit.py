@@ -0,0 +1,101 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import singer
+
+
+LOGGER = singer.get_logger()
+
+DEFAULT_MAX_REQUESTS_PER_SECOND = 20.0
+DEFAULT_MIN_REQUESTS_PER_SECOND = 1.0
+# Additive increase per successful request and multiplicative decrease per 429
+RATE_INCREASE = 0.05
+RATE_DECREASE = 0.5
+
+
+def get_retry_after(headers):
+    '''
+    Returns the number of seconds a `Retry-After` header asks us to wait, if there is one
+    '''
+    if not headers:
+        return None
+
+    value = next((value for key, value in headers.items() if key.lower() == 'retry-after'), None)
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# The bucket's state is all read and updated together under one lock, splitting it up wouldn't make it simpler
+class RateLimiter(): # pylint: disable=too-many-instance-attributes
+    '''
+    A token bucket shared by every request the tap makes. Its rate backs off
+    multiplicatively when Square answers 429 and creeps back up additively on
+    success (AIMD), and a `Retry-After` pauses all requests until it passes.
+    '''
+    def __init__(self, max_rate=DEFAULT_MAX_REQUESTS_PER_SECOND, min_rate=DEFAULT_MIN_REQUESTS_PER_SECOND, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._clock = clock
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate = self.max_rate
+        self._tokens = 1.0
+        self._updated_at = clock()
+        self._blocked_until = 0.0
+
+    def configure(self, max_rate, min_rate=DEFAULT_MIN_REQUESTS_PER_SECOND):
+        '''
+        Sets new rate bounds and starts the bucket over, as the shared limiter is created before the config is read
+        '''
+        with self._lock:
+            self.max_rate = float(max_rate)
+            self.min_rate = min(float(min_rate), self.max_rate)
+            self.rate = self.max_rate
+            self._tokens = 1.0
+            self._updated_at = self._clock()
+            self._blocked_until = 0.0
+
+    def reserve(self):
+        '''
+        Takes a token and returns how many seconds the caller must wait before using it
+        '''
+        with self._lock:
+            now = self._clock()
+            # Allow bursts of up to one second's worth of requests
+            self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1.0
+
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, self._clock() + retry_after)
+            LOGGER.warning('Rate limited by Square, lowering request rate to %.2f requests per second', self.rate)
+
+
+RATE_LIMITER = RateLimiter()
@@ -1,29 +1,196 @@
+import copy
 from datetime import timedelta
+import hashlib
+import itertools
+import threading
 import singer
 from methodtools import lru_cache
 from requests.exceptions import RequestException
+from .concurrency import ordered_parallel_pages
+from .output import Output, StreamOutput
+from .version_index import VersionIndex
 
 LOGGER = singer.get_logger()
 
+def is_enabled(config, key):
+    """Reads a boolean config value, which may be given as a string like `sandbox`."""
+    value = config.get(key, False)
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value)
+
 def chunks(lst, n):
     """Yield successive n-sized chunks from lst."""
     for i in range(0, len(lst), n):
         yield lst[i:i + n]
 
-def get_date_windows(start_time):
-    window_start = singer.utils.strptime_to_utc(start_time)
-    now = singer.utils.now()
-    while window_start < now:
-        window_end = window_start + timedelta(days=7)
-        if window_end > now:
-            window_end = now
-        yield singer.utils.strftime(window_start), singer.utils.strftime(window_end)
-        window_start = window_end
+class DateWindows:
+    '''
+    Date windows from `start_time` up to now. After each window is searched,
+    `observe` resizes the windows that follow, doubling them while windows
+    return fewer than `sparse_records` records and halving them when a window
+    takes more than `max_pages` pages, always within `min_days` and
+    `max_days`. `split` halves the current window and searches it again. With
+    both bounds equal the windows have a fixed size.
+    '''
+    def __init__(self, start_time, initial_days=7, min_days=7, max_days=7, max_pages=10, sparse_records=100):
+        self.window_start = singer.utils.strptime_to_utc(start_time)
+        self.min_size = timedelta(days=min_days)
+        self.max_size = timedelta(days=max(min_days, max_days))
+        self.size = min(self.max_size, max(self.min_size, timedelta(days=initial_days)))
+        self.max_pages = max_pages
+        self.sparse_records = sparse_records
+        self._repeat = False
+
+    def __iter__(self):
+        now = singer.utils.now()
+        while self.window_start < now:
+            window_end = self.window_start + self.size
+            if window_end > now:
+                window_end = now
+            yield singer.utils.strftime(self.window_start), singer.utils.strftime(window_end)
+            if self._repeat:
+                self._repeat = False
+            else:
+                self.window_start = window_end
+
+    def can_split(self):
+        return self.size > self.min_size
+
+    def split(self):
+        self.size = max(self.min_size, self.size / 2)
+        self._repeat = True
+
+    def observe(self, record_count, page_count):
+        if page_count > self.max_pages:
+            self.size = max(self.min_size, self.size / 2)
+        elif record_count < self.sparse_records:
+            self.size = min(self.max_size, self.size * 2)
+
+
+def get_customer_windows(start_time, config):
+    if not is_enabled(config, 'adaptive_customer_windows'):
+        return DateWindows(start_time)
+    return DateWindows(
+        start_time,
+        min_days=float(config.get('customers_window_min_days', 1)),
+        max_days=float(config.get('customers_window_max_days', 180)),
+        max_pages=int(config.get('customers_window_max_pages', 10)),
+    )
+
+
+def get_time_slices(start_time, end_time, slice_days=None):
+    '''
+    Splits `start_time` to `end_time` into consecutive `(begin, end)` slices of
+    `slice_days` days, or returns the whole range as one slice without it
+    '''
+    if not slice_days:
+        return [(start_time, end_time)]
+
+    slice_begin = singer.utils.strptime_to_utc(start_time)
+    range_end = singer.utils.strptime_to_utc(end_time)
+    boundaries = [start_time]
+    while slice_begin + timedelta(days=slice_days) < range_end:
+        slice_begin += timedelta(days=slice_days)
+        boundaries.append(singer.utils.strftime(slice_begin))
+    boundaries.append(end_time)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def get_chunk_key(location_ids):
+    '''
+    A short key for a chunk of locations, whatever order they come in, as every STATE carries one per chunk
+    '''
+    return hashlib.sha1(','.join(sorted(location_ids)).encode('utf-8')).hexdigest()[:16]
+
+
+class LocationProgress:
+    '''
+    Keeps track of a sync that goes location by location, optionally in time
+    slices per location, in the stream's bookmarks: the locations already
+    finished and, for the location in progress, the beginning of its first
+    unfinished slice and the cursor of that slice's next page. A failed run
+    resumes where it stopped.
+    '''
+    def __init__(self, state, tap_stream_id):
+        self.state = state
+        self.tap_stream_id = tap_stream_id
+        # Read up front, as pages may be requested from other threads while progress is recorded
+        self.resume_location_id = singer.get_bookmark(state, tap_stream_id, 'location_id')
+        self.resume_slice_begin_time = singer.get_bookmark(state, tap_stream_id, 'slice_begin_time')
+        self.resume_cursor = singer.get_bookmark(state, tap_stream_id, 'cursor')
+
+    def get_remaining(self, location_ids):
+        completed = set(singer.get_bookmark(self.state, self.tap_stream_id, 'completed_location_ids', []))
+        return [location_id for location_id in location_ids if location_id not in completed]
+
+    def is_completed_slice(self, location_id, slice_end_time):
+        if location_id != self.resume_location_id or self.resume_slice_begin_time is None:
+            return False
+        return singer.utils.strptime_to_utc(slice_end_time) <= singer.utils.strptime_to_utc(self.resume_slice_begin_time)
+
+    def get_cursor(self, location_id, slice_begin_time=None):
+        if location_id == self.resume_location_id and slice_begin_time == self.resume_slice_begin_time:
+            return self.resume_cursor
+        return None
+
+    def advance(self, location_id, cursor, slice_begin_time=None, next_slice_begin_time=None):
+        '''
+        Records that the slice of `location_id` beginning at `slice_begin_time` has been written up to
+        `cursor`. Without a cursor the slice is finished, and so is the location if there's no next slice.
+        '''
+        if cursor or next_slice_begin_time:
+            singer.write_bookmark(self.state, self.tap_stream_id, 'location_id', location_id)
+            self._write_or_clear('slice_begin_time', slice_begin_time if cursor else next_slice_begin_time)
+            self._write_or_clear('cursor', cursor)
+            return
+
+        completed = singer.get_bookmark(self.state, self.tap_stream_id, 'completed_location_ids', [])
+        singer.write_bookmark(self.state, self.tap_stream_id, 'completed_location_ids', completed + [location_id])
+        for key in ['location_id', 'slice_begin_time', 'cursor']:
+            singer.clear_bookmark(self.state, self.tap_stream_id, key)
+
+    def _write_or_clear(self, key, value):
+        if value is None:
+            singer.clear_bookmark(self.state, self.tap_stream_id, key)
+        else:
+            singer.write_bookmark(self.state, self.tap_stream_id, key, value)
+
+    def clear(self):
+        for key in ['completed_location_ids', 'location_id', 'slice_begin_time', 'cursor']:
+            singer.clear_bookmark(self.state, self.tap_stream_id, key)
 
 
 class Stream:
-    def __init__(self, client):
+    tap_stream_id = None
+    # Rough relative sync time, used to start the slowest streams first when syncing in parallel
+    estimated_cost = 1
+
+    def __init__(self, client, config=None, output=None):
         self.client = client
+        self.config = config or {}
+        self.output = output or StreamOutput(Output(), self.tap_stream_id)
+
+    def get_location_concurrency(self):
+        return int(self.config.get('location_concurrency', 1))
+
+    def get_location_ids(self):
+        '''
+        The locations to sync location by location, leaving out inactive ones when `skip_inactive_locations` is set
+        '''
+        return Locations.get_all_location_ids(self.client, skip_inactive=is_enabled(self.config, 'skip_inactive_locations'))
+
+    def get_pages_by_location(self, request_method, location_ids, *args):
+        '''
+        Calls `request_method(location_id, *args)` for every location, fetching up to
+        `location_concurrency` locations at a time, and yields `(location_id, page)`
+        in the order of `location_ids`
+        '''
+        tasks = (
+            (location_id, lambda location_id=location_id: request_method(location_id, *args))
+            for location_id in location_ids
+        )
+        yield from ordered_parallel_pages(tasks, self.get_location_concurrency())
 
 
 class CatalogStream(Stream):
@@ -31,21 +198,32 @@ class CatalogStream(Stream):
     tap_stream_id = None
     replication_key = None
 
+    @lru_cache()
+    @classmethod
+    def get_catalog_latest_time(cls, client):
+        return client.get_catalog_latest_time()
+
+    def is_unchanged_since(self, start_time):
+        # Called on CatalogStream so every catalog stream shares the one lookup
+        latest_time = CatalogStream.get_catalog_latest_time(self.client)
+        return latest_time is not None and singer.utils.strptime_to_utc(latest_time) <= singer.utils.strptime_to_utc(start_time)
+
     def sync(self, state, stream_schema, stream_metadata, config, transformer):
         start_time = singer.get_bookmark(state, self.tap_stream_id, self.replication_key, config['start_date'])
+        if is_enabled(config, 'skip_unchanged_catalog') and self.is_unchanged_since(start_time):
+            LOGGER.info('The catalog has not changed since %s, skipping %s', start_time, self.tap_stream_id)
+            return state
+
         max_record_value = start_time
         for page, _ in self.client.get_catalog(self.object_type, start_time):
             for record in page:
                 transformed_record = transformer.transform(record, stream_schema, stream_metadata)
-                singer.write_record(
-                    self.tap_stream_id,
-                    transformed_record,
-                )
+                self.output.write_record(transformed_record)
                 if record[self.replication_key] > max_record_value:
                     max_record_value = transformed_record[self.replication_key]
 
             state = singer.write_bookmark(state, self.tap_stream_id, self.replication_key, max_record_value)
-            singer.write_state(state)
+            self.output.checkpoint(state)
         return state
 
 
@@ -57,15 +235,18 @@ class FullTableStream(Stream):
     replication_key = None
 
     def get_pages_safe(self, state, bookmarked_cursor, start_time):
+        yield from self.clear_cursor_on_error(state, self.get_pages(bookmarked_cursor, start_time))
+
+    def clear_cursor_on_error(self, state, pages):
         try:
-            yield from self.get_pages(bookmarked_cursor, start_time)
+            yield from pages
         except (RuntimeError, RequestException):
             # NB> If we get a non-retryable error we should delete the
             # pagination cursor bookmark before re-raising the exception.
             LOGGER.fatal("Received fatal exception during syncing of stream %s, Clearing cursor bookmark.", self.tap_stream_id)
 
             state = singer.clear_bookmark(state, self.tap_stream_id, 'cursor')
-            singer.write_state(state)
+            self.output.write_state(state)
             raise
 
     def get_pages(self, bookmarked_cursor, start_time):
@@ -78,13 +259,10 @@ class FullTableStream(Stream):
         for page, _ in self.get_pages_safe(state, bookmarked_cursor, start_time):
             for record in page:
                 transformed_record = transformer.transform(record, stream_schema, stream_metadata)
-                singer.write_record(
-                    self.tap_stream_id,
-                    transformed_record,
-                )
+                self.output.write_record(transformed_record)
 
         state = singer.clear_bookmark(state, self.tap_stream_id, 'cursor')
-        singer.write_state(state)
+        self.output.checkpoint(state)
         return state
 
 
@@ -140,18 +318,37 @@ class Locations(FullTableStream):
     valid_replication_keys = []
     replication_key = None
 
+    _locations_lock = threading.Lock()
+
     @lru_cache()
     @classmethod
-    def get_all_location_ids(cls, client):
-        all_location_ids = list()
+    def _fetch_all_locations(cls, client):
+        all_locations = list()
         for page, _ in client.get_locations():
-            for location in page:
-                all_location_ids.append(location['id'])
+            all_locations.extend(page)
 
-        return all_location_ids
+        return all_locations
+
+    @classmethod
+    def get_all_locations(cls, client):
+        '''
+        Every location record, fetched once per client and shared by all the streams that need them.
+        Callers get copies, as the transformer drops deselected fields from records in place.
+        '''
+        # Streams syncing in parallel would otherwise all miss the cache at once
+        with cls._locations_lock:
+            return copy.deepcopy(cls._fetch_all_locations(client))
+
+    @classmethod
+    def get_all_location_ids(cls, client, skip_inactive=False):
+        return [
+            location['id'] for location in cls.get_all_locations(client)
+            if not (skip_inactive and location.get('status') == 'INACTIVE')
+        ]
 
     def get_pages(self, bookmarked_cursor, start_time):
-        yield from self.client.get_locations()
+        # The locations endpoint isn't paginated, so the shared list is the one page
+        yield (Locations.get_all_locations(self.client), None)
 
 
 class BankAccounts(FullTableStream):
@@ -169,13 +366,37 @@ class BankAccounts(FullTableStream):
 class Refunds(FullTableStream):
     tap_stream_id = 'refunds'
     key_properties = ['id']
-    replication_method = 'FULL_TABLE'
-    valid_replication_keys = []
-    replication_key = None
+    replication_method = 'INCREMENTAL'
+    valid_replication_keys = ['created_at']
+    replication_key = 'created_at'
     object_type = 'REFUND'
+    # Long enough for most refunds to have settled, so their final status gets synced
+    default_lookback_days = 14
 
     def get_pages(self, bookmarked_cursor, start_time):
-        yield from self.client.get_refunds(start_time, bookmarked_cursor)
+        # Oldest first, so the bookmark can move with every page
+        yield from self.client.get_refunds(start_time, bookmarked_cursor, 'ASC')
+
+    def sync(self, state, stream_schema, stream_metadata, config, transformer):
+        start_time = singer.get_bookmark(state, self.tap_stream_id, self.replication_key, config['start_date'])
+        max_record_value = start_time
+
+        # Refunds can only be searched by when they were created, so re-read recent
+        # ones to pick up changes to refunds that were still pending
+        begin_time = singer.utils.strptime_to_utc(start_time) - timedelta(days=float(config.get('refunds_lookback_days', self.default_lookback_days)))
+        begin_time = singer.utils.strftime(max(begin_time, singer.utils.strptime_to_utc(config['start_date'])))
+
+        for page, _ in self.get_pages_safe(state, None, begin_time):
+            for record in page:
+                transformed_record = transformer.transform(record, stream_schema, stream_metadata)
+                self.output.write_record(transformed_record)
+                if singer.utils.strptime_to_utc(record[self.replication_key]) > \
+                   singer.utils.strptime_to_utc(max_record_value):
+                    max_record_value = transformed_record[self.replication_key]
+
+            state = singer.write_bookmark(state, self.tap_stream_id, self.replication_key, max_record_value)
+            self.output.checkpoint(state)
+        return state
 
 
 class Payments(Stream):
@@ -184,6 +405,7 @@ class Payments(Stream):
     replication_method = 'INCREMENTAL'
     valid_replication_keys = ['updated_at']
     replication_key = 'updated_at'
+    estimated_cost = 8
     # If the records are not updated at all since those are created and if it has missing the updated_at field
     second_replication_key = 'created_at'
     object_type = 'PAYMENT'
@@ -191,22 +413,50 @@ class Payments(Stream):
 
     def sync(self, state, stream_schema, stream_metadata, config, transformer):
         bookmarked_time = singer.get_bookmark(state, self.tap_stream_id, self.replication_key, config['start_date'])
-        max_bookmark_value = bookmarked_time
-        all_location_ids = Locations.get_all_location_ids(self.client)
+        # A run that didn't finish saved its end time, which its cursors are only valid with
+        sync_end = singer.get_bookmark(state, self.tap_stream_id, 'sync_end') or \
+            singer.utils.strftime(singer.utils.now(), singer.utils.DATETIME_PARSE)
+        max_bookmark_value = singer.get_bookmark(state, self.tap_stream_id, 'max_updated_at', bookmarked_time)
+        all_location_ids = self.get_location_ids()
+
+        progress = LocationProgress(state, self.tap_stream_id)
+        state = singer.write_bookmark(state, self.tap_stream_id, 'sync_end', sync_end)
+        time_slices = get_time_slices(bookmarked_time, sync_end, float(config.get('payments_time_slice_days', 0)))
+
+        # Slices of every location are fetched location_concurrency at a time and written in order
+        tasks = []
+        for location_id in progress.get_remaining(all_location_ids):
+            for slice_number, (slice_begin, slice_end) in enumerate(time_slices):
+                if progress.is_completed_slice(location_id, slice_end):
+                    continue
+                next_slice_begin = time_slices[slice_number + 1][0] if slice_number + 1 < len(time_slices) else None
+                tasks.append((
+                    (location_id, slice_begin, next_slice_begin),
+                    lambda location_id=location_id, slice_begin=slice_begin, slice_end=slice_end:
+                    self.client.get_payments(
+                        location_id, slice_begin, progress.get_cursor(location_id, slice_begin), slice_end),
+                ))
+
+        pages = ordered_parallel_pages(tasks, self.get_location_concurrency())
+        for (location_id, slice_begin, next_slice_begin), (page, cursor) in pages:
+            for record in page:
+                transformed_record = transformer.transform(record, stream_schema, stream_metadata)
 
-        for location_id in all_location_ids:
-            for page, _ in self.client.get_payments(location_id, bookmarked_time, bookmarked_cursor=None):
-                for record in page:
-                    transformed_record = transformer.transform(record, stream_schema, stream_metadata)
+                if record.get(self.replication_key, self.second_replication_key) >= bookmarked_time:
+                    self.output.write_record(transformed_record)
+                    max_bookmark_value = max(transformed_record.get(self.replication_key) or \
+                                           transformed_record.get(self.second_replication_key), \
+                                            max_bookmark_value)
 
-                    if record.get(self.replication_key, self.second_replication_key) >= bookmarked_time:
-                        singer.write_record(self.tap_stream_id, transformed_record,)
-                        max_bookmark_value = max(transformed_record.get(self.replication_key) or \
-                                               transformed_record.get(self.second_replication_key), \
-                                                max_bookmark_value)
+            progress.advance(location_id, cursor, slice_begin, next_slice_begin)
+            state = singer.write_bookmark(state, self.tap_stream_id, 'max_updated_at', max_bookmark_value)
+            self.output.checkpoint(state)
 
+        progress.clear()
+        for key in ['sync_end', 'max_updated_at']:
+            state = singer.clear_bookmark(state, self.tap_stream_id, key)
         state = singer.write_bookmark(state, self.tap_stream_id, self.replication_key, max_bookmark_value)
-        singer.write_state(state)
+        self.output.checkpoint(state)
         return state
 
 
@@ -216,27 +466,81 @@ class Orders(Stream):
     replication_method = 'INCREMENTAL'
     valid_replication_keys = ['updated_at']
     replication_key = 'updated_at'
+    estimated_cost = 10
     object_type = 'ORDER'
 
     def sync(self, state, stream_schema, stream_metadata, config, transformer):
+        index_path = config.get('orders_version_index_path')
+        if not index_path:
+            return self.sync_orders(state, stream_schema, stream_metadata, config, transformer)
+
+        with VersionIndex(index_path, 'orders') as index:
+            state = self.sync_orders(state, stream_schema, stream_metadata, config, transformer, index)
+            # Versions seen this run only count once the state covering them is out
+            self.output.write_state(state)
+            index.commit()
+        return state
+
+    def retrieve_changed_orders(self, order_entries, index):
+        order_ids = index.get_changed([(entry['order_id'], entry.get('version')) for entry in order_entries])
+        LOGGER.info('%s of %s orders changed', len(order_ids), len(order_entries))
+
+        orders = []
+        # Orders can be retrieved up to 100 at a time
+        for order_ids_chunk in chunks(order_ids, 100):
+            orders.extend(self.client.batch_retrieve_orders(order_ids_chunk))
+        return orders
+
+    def sync_orders(self, state, stream_schema, stream_metadata, config, transformer, index=None):
+        '''
+        With a version `index`, only orders whose version changed since they were
+        last synced are retrieved, unless there's no bookmark to resume from.
+        '''
         start_time = singer.get_bookmark(state, self.tap_stream_id, self.replication_key, config['start_date'])
-        max_record_value = start_time
-        all_location_ids = Locations.get_all_location_ids(self.client)
+        # The progress of each chunk in a run that hasn't finished. The stream bookmark only moves once
+        # every chunk is done, so it is where the run started for any chunk without progress of its own.
+        chunk_bookmarks = singer.get_bookmark(state, self.tap_stream_id, 'chunk_bookmarks', {})
+        all_location_ids = self.get_location_ids()
+
+        use_index = index is not None and singer.get_bookmark(state, self.tap_stream_id, self.replication_key) is not None
+        request_method = self.client.get_order_entries if use_index else self.client.get_orders
 
+        # orders requests can only take up to 10 location_ids at a time
+        chunk_max_values = {}
+        tasks = []
         for location_ids_chunk in chunks(all_location_ids, 10):
-            # orders requests can only take up to 10 location_ids at a time
-            for page, _ in self.client.get_orders(location_ids_chunk, start_time):
-                for record in page:
-                    transformed_record = transformer.transform(record, stream_schema, stream_metadata)
-                    singer.write_record(
-                        self.tap_stream_id,
-                        transformed_record,
-                    )
-                    if record[self.replication_key] > max_record_value:
-                        max_record_value = transformed_record[self.replication_key]
+            chunk_key = get_chunk_key(location_ids_chunk)
+            chunk_start_time = chunk_bookmarks.get(chunk_key, start_time)
+            chunk_max_values[chunk_key] = chunk_start_time
+            tasks.append((
+                chunk_key,
+                lambda location_ids_chunk=location_ids_chunk, chunk_start_time=chunk_start_time:
+                request_method(location_ids_chunk, chunk_start_time),
+            ))
+
+        for chunk_key, (page, _) in ordered_parallel_pages(tasks, self.get_location_concurrency()):
+            if use_index:
+                page = self.retrieve_changed_orders(page, index)
 
-                state = singer.write_bookmark(state, self.tap_stream_id, self.replication_key, max_record_value)
-                singer.write_state(state)
+            for record in page:
+                transformed_record = transformer.transform(record, stream_schema, stream_metadata)
+                self.output.write_record(transformed_record)
+                if record[self.replication_key] > chunk_max_values[chunk_key]:
+                    chunk_max_values[chunk_key] = transformed_record[self.replication_key]
+
+            if index is not None:
+                # Orders not created through the API, like POS orders, have no version
+                index.stage([(record['id'], record.get('version')) for record in page])
+
+            # Chunks are written in order, so a chunk's progress is only saved once its pages are written
+            chunk_bookmarks[chunk_key] = chunk_max_values[chunk_key]
+            state = singer.write_bookmark(state, self.tap_stream_id, 'chunk_bookmarks', chunk_bookmarks)
+            self.output.checkpoint(state)
+
+        max_record_value = max([start_time, *chunk_max_values.values()], key=singer.utils.strptime_to_utc)
+        state = singer.clear_bookmark(state, self.tap_stream_id, 'chunk_bookmarks')
+        state = singer.write_bookmark(state, self.tap_stream_id, self.replication_key, max_record_value)
+        self.output.checkpoint(state)
         return state
 
 
@@ -246,10 +550,72 @@ class Inventories(FullTableStream):
     replication_method = 'FULL_TABLE'
     valid_replication_keys = []
     replication_key = None
+    # Bookmarked only when `incremental_inventories` is set
+    incremental_replication_key = 'calculated_at'
+    estimated_cost = 6
 
     def get_pages(self, bookmarked_cursor, start_time):
         yield from self.client.get_inventories(start_time, bookmarked_cursor)
 
+    def sync(self, state, stream_schema, stream_metadata, config, transformer):
+        if is_enabled(config, 'incremental_inventories'):
+            return self.sync_incremental(state, stream_schema, stream_metadata, config, transformer)
+
+        if not is_enabled(config, 'partition_inventories_by_location'):
+            return super().sync(state, stream_schema, stream_metadata, config, transformer)
+
+        state = self.sync_by_location(state, config['start_date'], stream_schema, stream_metadata, transformer)
+        self.output.checkpoint(state)
+        return state
+
+    def sync_incremental(self, state, stream_schema, stream_metadata, config, transformer):
+        # Only counts calculated after the bookmark are returned, but in no particular
+        # order, so the bookmark moves to when the sync started once it finishes
+        start_time = singer.get_bookmark(state, self.tap_stream_id, self.incremental_replication_key, config['start_date'])
+        sync_start_bookmark = singer.get_bookmark(
+            state,
+            self.tap_stream_id,
+            'sync_start',
+            singer.utils.strftime(singer.utils.now(),
+                                  format_str=singer.utils.DATETIME_PARSE)
+        )
+        state = singer.write_bookmark(state, self.tap_stream_id, 'sync_start', sync_start_bookmark)
+
+        if is_enabled(config, 'partition_inventories_by_location'):
+            state = self.sync_by_location(state, start_time, stream_schema, stream_metadata, transformer)
+        else:
+            bookmarked_cursor = singer.get_bookmark(state, self.tap_stream_id, 'cursor')
+            for page, cursor in self.get_pages_safe(state, bookmarked_cursor, start_time):
+                for record in page:
+                    transformed_record = transformer.transform(record, stream_schema, stream_metadata)
+                    self.output.write_record(transformed_record)
+                state = singer.write_bookmark(state, self.tap_stream_id, 'cursor', cursor)
+                self.output.checkpoint(state)
+
+        state = singer.clear_bookmark(state, self.tap_stream_id, 'sync_start')
+        state = singer.clear_bookmark(state, self.tap_stream_id, 'cursor')
+        state = singer.write_bookmark(state, self.tap_stream_id, self.incremental_replication_key, sync_start_bookmark)
+        self.output.checkpoint(state)
+        return state
+
+    def sync_by_location(self, state, start_time, stream_schema, stream_metadata, transformer):
+        all_location_ids = self.get_location_ids()
+
+        progress = LocationProgress(state, self.tap_stream_id)
+        pages = self.get_pages_by_location(
+            lambda location_id: self.client.get_inventories(start_time, progress.get_cursor(location_id), [location_id]),
+            progress.get_remaining(all_location_ids))
+        for location_id, (page, cursor) in self.clear_cursor_on_error(state, pages):
+            for record in page:
+                transformed_record = transformer.transform(record, stream_schema, stream_metadata)
+                self.output.write_record(transformed_record)
+
+            progress.advance(location_id, cursor)
+            self.output.checkpoint(state)
+
+        progress.clear()
+        return state
+
 
 class Shifts(FullTableStream):
     tap_stream_id = 'shifts'
@@ -257,9 +623,12 @@ class Shifts(FullTableStream):
     replication_method = 'INCREMENTAL'
     valid_replication_keys = ['updated_at']
     replication_key = 'updated_at'
+    estimated_cost = 5
+    # Newest first, so the search can stop at the first shift older than the bookmark
+    sort_order = 'DESC'
 
     def get_pages(self, bookmarked_cursor, start_time):
-        yield from self.client.get_shifts(bookmarked_cursor)
+        yield from self.client.get_shifts(bookmarked_cursor, self.sort_order)
 
     def sync(self, state, stream_schema, stream_metadata, config, transformer):
         start_time = singer.get_bookmark(state, self.tap_stream_id, self.replication_key, config['start_date'])
@@ -279,29 +648,40 @@ class Shifts(FullTableStream):
         )
 
         bookmarked_cursor = singer.get_bookmark(state, self.tap_stream_id, 'cursor')
-
-        for page, cursor in self.get_pages_safe(state, bookmarked_cursor, start_time):
-            for record in page:
-                if record[self.replication_key] >= start_time:
+        # Cursors only continue the search they came from, and older versions searched oldest first
+        if bookmarked_cursor and singer.get_bookmark(state, self.tap_stream_id, 'cursor_sort_order') != self.sort_order:
+            LOGGER.info('Not resuming %s from a cursor saved for another sort order', self.tap_stream_id)
+            bookmarked_cursor = None
+        start = singer.utils.strptime_to_utc(start_time)
+
+        pages = self.get_pages_safe(state, bookmarked_cursor, start_time)
+        for page, cursor in pages:
+            older_than_start = [singer.utils.strptime_to_utc(record[self.replication_key]) < start for record in page]
+            for record, is_older in zip(page, older_than_start):
+                if not is_older:
                     transformed_record = transformer.transform(
                         record, stream_schema, stream_metadata,
                     )
-                    singer.write_record(
-                        self.tap_stream_id,
-                        transformed_record,
-                    )
+                    self.output.write_record(transformed_record)
+
+            if any(older_than_start):
+                # Every shift on the pages that follow is older still
+                pages.close()
+                break
             state = singer.write_bookmark(state, self.tap_stream_id, 'cursor', cursor)
-            singer.write_state(state)
+            state = singer.write_bookmark(state, self.tap_stream_id, 'cursor_sort_order', self.sort_order)
+            self.output.checkpoint(state)
 
         state = singer.clear_bookmark(state, self.tap_stream_id, 'sync_start')
         state = singer.clear_bookmark(state, self.tap_stream_id, 'cursor')
+        state = singer.clear_bookmark(state, self.tap_stream_id, 'cursor_sort_order')
         state = singer.write_bookmark(
             state,
             self.tap_stream_id,
             self.replication_key,
             sync_start_bookmark,
         )
-        singer.write_state(state)
+        self.output.checkpoint(state)
         return state
 
 
@@ -312,11 +692,14 @@ class CashDrawerShifts(FullTableStream):
     replication_method = 'FULL_TABLE'
     valid_replication_keys = []
     replication_key = None
+    estimated_cost = 3
 
     def get_pages(self, bookmarked_cursor, start_time):
-        for location_id in Locations.get_all_location_ids(self.client):
-            # Cash Drawer Shifts requests can only take up to 1 location_id at a time
-            yield from self.client.get_cash_drawer_shifts(location_id, start_time, bookmarked_cursor)
+        # Cash Drawer Shifts requests can only take up to 1 location_id at a time
+        all_location_ids = self.get_location_ids()
+        pages = self.get_pages_by_location(self.client.get_cash_drawer_shifts, all_location_ids, start_time, bookmarked_cursor)
+        for _, page in pages:
+            yield page
 
 
 class Payouts(FullTableStream):
@@ -325,11 +708,14 @@ class Payouts(FullTableStream):
     replication_method = 'FULL_TABLE'
     valid_replication_keys = []
     replication_key = None
+    estimated_cost = 3
 
     def get_pages(self, bookmarked_cursor, start_time):
-        for location_id in Locations.get_all_location_ids(self.client):
-            # payouts requests can only take up to 1 location_id at a time
-            yield from self.client.get_payouts(location_id, start_time, bookmarked_cursor)
+        # payouts requests can only take up to 1 location_id at a time
+        all_location_ids = self.get_location_ids()
+        pages = self.get_pages_by_location(self.client.get_payouts, all_location_ids, start_time, bookmarked_cursor)
+        for _, page in pages:
+            yield page
 
 class TeamMembers(Stream):
     tap_stream_id = 'team_members'
@@ -337,23 +723,51 @@ class TeamMembers(Stream):
     replication_method = 'INCREMENTAL'
     valid_replication_keys = ['updated_at']
     replication_key = 'updated_at'
+    estimated_cost = 2
     object_type = 'team_members'
 
     def sync(self, state, stream_schema, stream_metadata, config, transformer):
+        digest_path = config.get('team_members_digest_path')
+        if not digest_path:
+            return self.sync_team_members(state, stream_schema, stream_metadata, config, transformer)
+
+        with VersionIndex(digest_path, 'team_members') as digest:
+            state = self.sync_team_members(state, stream_schema, stream_metadata, config, transformer, digest)
+            # Team members seen this run only count once the state covering them is out
+            self.output.write_state(state)
+            digest.commit()
+        return state
+
+    def sync_team_members(self, state, stream_schema, stream_metadata, config, transformer, digest=None):
+        '''
+        With a `digest` of each team member's last synced `updated_at`, team
+        members that haven't changed since are skipped, unless there's no
+        bookmark to resume from.
+        '''
         start_time = singer.get_bookmark(state, self.tap_stream_id, self.replication_key, config['start_date'])
+        start = singer.utils.strptime_to_utc(start_time)
         max_record_value = start_time
         all_location_ids = Locations.get_all_location_ids(self.client)
+        use_digest = digest is not None and singer.get_bookmark(state, self.tap_stream_id, self.replication_key) is not None
 
         for page, _ in self.client.get_team_members(all_location_ids):
-            for record in page:
-                transformed_record = transformer.transform(record, stream_schema, stream_metadata)
+            # Filter the raw records, so team members that are skipped aren't transformed
+            records = [record for record in page if singer.utils.strptime_to_utc(record[self.replication_key]) >= start]
+            if use_digest:
+                changed_ids = set(digest.get_changed([(record['id'], record[self.replication_key]) for record in records]))
+                records = [record for record in records if record['id'] in changed_ids]
 
-                if record[self.replication_key] > max_record_value:
-                    singer.write_record(self.tap_stream_id, transformed_record,)
+            for record in records:
+                transformed_record = transformer.transform(record, stream_schema, stream_metadata)
+                self.output.write_record(transformed_record)
+                if singer.utils.strptime_to_utc(transformed_record[self.replication_key]) > \
+                   singer.utils.strptime_to_utc(max_record_value):
                     max_record_value = transformed_record[self.replication_key]
 
+            if digest is not None:
+                digest.stage([(record['id'], record[self.replication_key]) for record in records])
             state = singer.write_bookmark(state, self.tap_stream_id, self.replication_key, max_record_value)
-            singer.write_state(state)
+            self.output.checkpoint(state)
         return state
 
 class Customers(Stream):
@@ -362,22 +776,67 @@ class Customers(Stream):
     replication_method = 'INCREMENTAL'
     valid_replication_keys = ['updated_at']
     replication_key = 'updated_at'
+    estimated_cost = 6
 
     def sync(self, state, stream_schema, stream_metadata, config, transformer):
         start_time = singer.get_bookmark(state, self.tap_stream_id, self.replication_key, config['start_date'])
-        for window_start, window_end in get_date_windows(start_time):
-            LOGGER.info("Searching for customers from %s to %s", window_start, window_end)
-            for page, _ in self.client.get_customers(window_start, window_end):
+        windows = get_customer_windows(start_time, config)
+        max_workers = int(config.get('customers_window_concurrency', 1))
+        for (_, window_end), pages in self.get_pages_by_window(windows, max_workers):
+            record_count = page_count = 0
+            for page, _ in pages:
+                page_count += 1
                 for record in page:
+                    record_count += 1
                     transformed_record = transformer.transform(record, stream_schema, stream_metadata)
-                    singer.write_record(
-                        self.tap_stream_id,
-                        transformed_record,
-                    )
+                    self.output.write_record(transformed_record)
+            windows.observe(record_count, page_count)
+            # Windows come back in order, so every window before this one has been written too
             state = singer.write_bookmark(state, self.tap_stream_id, self.replication_key, window_end)
-            singer.write_state(state)
+            self.output.checkpoint(state)
         return state
 
+    def search_window(self, window_start, window_end):
+        LOGGER.info("Searching for customers from %s to %s", window_start, window_end)
+        return self.client.get_customers(window_start, window_end)
+
+    def get_pages_by_window(self, windows, max_workers):
+        '''
+        Yields each window with its pages in window order, searching up to
+        `max_workers` windows at a time. Windows are only split when they are
+        searched one at a time.
+        '''
+        if max_workers > 1:
+            tasks = ((window, lambda window=window: self.search_window(*window)) for window in windows)
+            pages = ordered_parallel_pages(tasks, max_workers)
+            for window, window_pages in itertools.groupby(pages, key=lambda item: item[0]):
+                yield window, (page for _, page in window_pages)
+            return
+
+        for window in windows:
+            window_pages = self.get_window_pages(windows, *window)
+            if window_pages is None:
+                LOGGER.info("Too many customers from %s to %s, splitting the window", *window)
+                continue
+            yield window, window_pages
+
+    def get_window_pages(self, windows, window_start, window_end):
+        '''
+        Returns the window's pages, or None when it takes more than `max_pages`
+        pages and has been split instead. Those first pages are held back so
+        nothing from a window that gets split is written.
+        '''
+        pages = self.search_window(window_start, window_end)
+        if not windows.can_split():
+            return pages
+
+        held_pages = list(itertools.islice(pages, windows.max_pages + 1))
+        if len(held_pages) > windows.max_pages:
+            pages.close()
+            windows.split()
+            return None
+        return held_pages
+
 STREAMS = {
     'items': Items,
     'categories': Categories,
@@ -1,35 +1,159 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
 import singer
 from singer import Transformer, metadata
+from .catalog_search import SharedCatalogClient
 from .client import SquareClient
-from .streams import STREAMS
+from .output import Output, StreamOutput
+from .streams import STREAMS, CatalogStream, is_enabled
+from .transform import CompiledTransformer
 
 
 LOGGER = singer.get_logger()
 
-def sync(config, config_path, state, catalog): # pylint: disable=too-many-statements
+
+def get_client(config, config_path):
     client = SquareClient(config, config_path)
 
-    with Transformer() as transformer:
-        for stream in catalog.get_selected_streams(state):
-            tap_stream_id = stream.tap_stream_id
-            stream_obj = STREAMS[tap_stream_id](client)
-            stream_schema = stream.schema.to_dict()
-            stream_metadata = metadata.to_map(stream.metadata)
+    client_backend = config.get('client_backend', 'sync')
+    if client_backend == 'async':
+        from .async_client import AsyncClientAdapter, AsyncSquareClient # pylint: disable=import-outside-toplevel
+        async_client = AsyncSquareClient(
+            client.access_token,
+            client.environment,
+            max_connections=int(config.get('async_max_connections', 100)),
+        )
+        return AsyncClientAdapter(async_client, client)
+    if client_backend != 'sync':
+        raise ValueError("Unknown client_backend {!r}, expected 'sync' or 'async'".format(client_backend))
+    return client
+
+
+def get_catalog_start_times(config, state, selected_streams):
+    start_times = {}
+    for stream in selected_streams:
+        stream_class = STREAMS[stream.tap_stream_id]
+        if issubclass(stream_class, CatalogStream):
+            start_times[stream_class.object_type] = singer.get_bookmark(
+                state, stream.tap_stream_id, stream_class.replication_key, config['start_date'])
+    return start_times
+
+
+def get_transformer(config):
+    if is_enabled(config, 'compiled_transforms'):
+        return CompiledTransformer()
+    return Transformer()
+
+
+def get_stream_cost(tap_stream_id, config):
+    stream_costs = config.get('stream_costs') or {}
+    return float(stream_costs.get(tap_stream_id, STREAMS[tap_stream_id].estimated_cost))
+
+
+def sync_stream(client, config, state, stream, output, transformer):
+    tap_stream_id = stream.tap_stream_id
+    stream_obj = STREAMS[tap_stream_id](client, config, output)
+    stream_schema = stream.schema.to_dict()
+    stream_metadata = metadata.to_map(stream.metadata)
+
+    LOGGER.info('Starting sync for stream: %s', tap_stream_id)
+
+    output.write_schema(
+        stream_schema,
+        stream_obj.key_properties,
+        stream.replication_key
+    )
+
+    try:
+        state = stream_obj.sync(state, stream_schema, stream_metadata, config, transformer)
+    except Exception:
+        # Don't lose progress held back by the checkpoint policy
+        output.write_pending_state()
+        raise
+    output.write_state(state)
+    LOGGER.info('Finished sync for stream: %s', tap_stream_id)
+    return state
+
+
+def get_stream_output(config, output, tap_stream_id, run_state=None):
+    return StreamOutput(
+        output,
+        tap_stream_id,
+        run_state=run_state,
+        checkpoint_records=int(config.get('state_checkpoint_records', 0)),
+        checkpoint_seconds=float(config.get('state_checkpoint_seconds', 0)),
+    )
+
+
+def sync_serially(client, config, state, selected_streams, output):
+    with get_transformer(config) as transformer:
+        for stream in selected_streams:
+            state = singer.set_currently_syncing(state, stream.tap_stream_id)
+            output.write_state(state)
+
+            state = sync_stream(client, config, state, stream, get_stream_output(config, output, stream.tap_stream_id), transformer)
+    return state
+
+
+def sync_in_parallel(client, config, state, selected_streams, output, max_parallel_streams):
+    '''
+    Syncs up to `max_parallel_streams` streams at a time. Every stream syncs
+    against its own copy of the state and all output goes through the shared
+    `output`, which merges each stream's bookmarks into `state` as they are written.
+    '''
+    # Start the most expensive streams first so cheap ones fill in around them
+    selected_streams = sorted(
+        selected_streams,
+        key=lambda stream: get_stream_cost(stream.tap_stream_id, config),
+        reverse=True,
+    )
+    LOGGER.info('Syncing up to %s streams in parallel: %s',
+                max_parallel_streams, [stream.tap_stream_id for stream in selected_streams])
+
+    def run(stream):
+        with output.lock:
+            stream_state = copy.deepcopy(state)
+        stream_output = get_stream_output(config, output, stream.tap_stream_id, run_state=state)
+        with get_transformer(config) as transformer:
+            sync_stream(client, config, stream_state, stream, stream_output, transformer)
+
+    state = singer.set_currently_syncing(state, None)
+    with ThreadPoolExecutor(max_workers=max_parallel_streams) as executor:
+        futures = [executor.submit(run, stream) for stream in selected_streams]
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            # Don't start streams that haven't begun; the running ones finish before this raises
+            for future in futures:
+                future.cancel()
+            raise
+    return state
 
-            LOGGER.info('Starting sync for stream: %s', tap_stream_id)
 
-            state = singer.set_currently_syncing(state, tap_stream_id)
-            singer.write_state(state)
+def sync(config, config_path, state, catalog):
+    client = get_client(config, config_path)
+    output = Output(
+        buffer_size=int(config.get('output_buffer_size', 0)),
+        flush_interval=float(config.get('output_flush_interval', 1.0)),
+    )
 
-            singer.write_schema(
-                tap_stream_id,
-                stream_schema,
-                stream_obj.key_properties,
-                stream.replication_key
-            )
+    selected_streams = list(catalog.get_selected_streams(state))
+    if is_enabled(config, 'shared_catalog_search'):
+        catalog_start_times = get_catalog_start_times(config, state, selected_streams)
+        if len(catalog_start_times) > 1:
+            client = SharedCatalogClient(client, catalog_start_times)
+    max_parallel_streams = int(config.get('max_parallel_streams', 1))
 
-            state = stream_obj.sync(state, stream_schema, stream_metadata, config, transformer)
-            singer.write_state(state)
+    try:
+        if max_parallel_streams > 1:
+            state = sync_in_parallel(client, config, state, selected_streams, output, max_parallel_streams)
+        else:
+            state = sync_serially(client, config, state, selected_streams, output)
+    finally:
+        # Records buffered before a failure still belong in the output
+        output.flush()
+        client.close()
 
     state = singer.set_currently_syncing(state, None)
-    singer.write_state(state)
+    output.write_state(state)
@@ -0,0 +1,324 @@
+import datetime
+import decimal
+import hashlib
+import json
+import re
+
+import pytz
+import singer
+from singer import Transformer
+from singer.transform import breadcrumb_path, string_to_datetime
+
+
+LOGGER = singer.get_logger()
+
+# Returned by compiled converters when a value doesn't match their type
+_FAIL = object()
+
+# The timestamp format Square returns; anything else is parsed by singer
+ISO_UTC_DATETIME = re.compile(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?Z$')
+
+
+class CannotCompile(Exception):
+    '''Raised for schemas using features the compiler doesn't reproduce'''
+
+
+class _UseTransformer(Exception):
+    '''Raised for records only the generic Transformer reproduces exactly'''
+
+
+def transform_datetime(value):
+    '''
+    Equivalent to singer's string_to_datetime, skipping dateutil for Square's own timestamp format
+    '''
+    match = ISO_UTC_DATETIME.match(value) if isinstance(value, str) else None
+    if match is None:
+        return string_to_datetime(value)
+
+    year, month, day, hour, minute, second, fraction = match.groups()
+    try:
+        parsed = datetime.datetime(
+            int(year), int(month), int(day), int(hour), int(minute), int(second),
+            int((fraction or '0').ljust(6, '0')), tzinfo=pytz.UTC)
+    except ValueError:
+        return string_to_datetime(value)
+    return singer.utils.strftime(parsed)
+
+
+def _is_dropped(metadata, breadcrumb):
+    inclusion = singer.metadata.get(metadata, breadcrumb, 'inclusion')
+    if inclusion == 'automatic':
+        return False
+    return singer.metadata.get(metadata, breadcrumb, 'selected') is False or inclusion == 'unsupported'
+
+
+def _has_drops_below(metadata, breadcrumb):
+    return any(
+        len(key) > len(breadcrumb) and key[:len(breadcrumb)] == breadcrumb and _is_dropped(metadata, key)
+        for key in metadata
+    )
+
+
+class _Compiler():
+    '''
+    Builds a converter function for each node of a schema. Converters mirror
+    `singer.Transformer._transform` for one type each and return `_FAIL`
+    where the Transformer would report a mismatch. Field selection is folded
+    in, dropping deselected fields at the node the Transformer's metadata
+    filter would have removed them.
+    '''
+    def __init__(self, metadata, removed, filtered):
+        self.metadata = metadata or {}
+        self.removed = removed
+        self.filtered = filtered
+
+    def compile(self, schema, breadcrumb=(), path=(), filtering=True):
+        if 'anyOf' in schema:
+            subschemas = [self.compile(subschema, breadcrumb, path, filtering) for subschema in schema['anyOf']]
+
+            def any_of(data):
+                for subschema in subschemas:
+                    value = subschema(data)
+                    if value is not _FAIL:
+                        return value
+                return _FAIL
+            return any_of
+
+        if 'type' not in schema:
+            self._check_untouched(breadcrumb, filtering)
+            return lambda data: data
+
+        types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+        # The Transformer always tries null last
+        types = [typ for typ in types if typ != 'null'] + (['null'] if 'null' in types else [])
+        converters = [self.compile_type(typ, schema, breadcrumb, path, filtering) for typ in types]
+
+        if len(converters) == 1:
+            return converters[0]
+
+        if len(converters) == 2:
+            first, second = converters
+
+            def either(data):
+                value = first(data)
+                return second(data) if value is _FAIL else value
+            return either
+
+        def one_of(data):
+            for converter in converters:
+                value = converter(data)
+                if value is not _FAIL:
+                    return value
+            return _FAIL
+        return one_of
+
+    def _check_untouched(self, breadcrumb, filtering):
+        # Data passed through as-is would still have had deselected fields filtered out of it
+        if filtering and self.metadata and _has_drops_below(self.metadata, breadcrumb):
+            raise CannotCompile('deselected fields under untyped schema at {}'.format(breadcrumb))
+
+    def compile_type(self, typ, schema, breadcrumb, path, filtering): # pylint: disable=too-many-return-statements
+        if typ == 'null':
+            return lambda data: None if data is None or data == '' else _FAIL
+
+        if schema.get('format') == 'date-time':
+            return compile_datetime()
+
+        if schema.get('format') == 'singer.decimal':
+            return compile_decimal()
+
+        if typ == 'object':
+            if schema.get('patternProperties'):
+                raise CannotCompile('patternProperties at {}'.format(breadcrumb))
+            return self.compile_object(schema.get('properties', {}), breadcrumb, path, filtering)
+
+        if typ == 'array':
+            if 'items' not in schema:
+                raise CannotCompile('array without items at {}'.format(breadcrumb))
+            items = self.compile(schema['items'], breadcrumb + ('items',), path, filtering)
+
+            def array(data):
+                if not isinstance(data, list):
+                    return _FAIL
+                result = []
+                for row in data:
+                    value = items(row)
+                    if value is _FAIL:
+                        return _FAIL
+                    result.append(value)
+                return result
+            return array
+
+        if typ == 'string':
+            return convert_string
+
+        if typ == 'integer':
+            return lambda data: convert_number(data, int)
+
+        if typ == 'number':
+            return lambda data: convert_number(data, float)
+
+        if typ == 'boolean':
+            return convert_boolean
+
+        return lambda data: _FAIL
+
+    def compile_object(self, properties, breadcrumb, path, filtering):
+        if properties == {}:
+            self._check_untouched(breadcrumb, filtering)
+            return lambda data: data if isinstance(data, dict) else _FAIL
+
+        dropped = set()
+        converters = {}
+        for key, subschema in properties.items():
+            field_breadcrumb = breadcrumb + ('properties', key)
+            if filtering and self.metadata and _is_dropped(self.metadata, field_breadcrumb):
+                dropped.add(key)
+                continue
+            # The metadata filter doesn't descend into automatic fields
+            automatic = singer.metadata.get(self.metadata, field_breadcrumb, 'inclusion') == 'automatic'
+            converters[key] = self.compile(subschema, field_breadcrumb, path + (key,), filtering and not automatic)
+
+        # Fields deselected in metadata but missing from the schema are dropped too
+        if filtering and self.metadata:
+            for key in self.metadata:
+                if len(key) == len(breadcrumb) + 2 and key[:len(breadcrumb) + 1] == breadcrumb + ('properties',) \
+                   and _is_dropped(self.metadata, key):
+                    dropped.add(key[-1])
+        filtered = {key: breadcrumb_path(breadcrumb + ('properties', key)) for key in dropped}
+        removed_prefix = '.'.join(path + ('',))
+
+        def obj(data):
+            if not isinstance(data, dict):
+                return _FAIL
+            result = {}
+            for key, value in data.items():
+                converter = converters.get(key)
+                if converter is None:
+                    if key in filtered:
+                        self.filtered.add(filtered[key])
+                    else:
+                        self.removed.add(removed_prefix + str(key))
+                    continue
+                value = converter(value)
+                if value is _FAIL:
+                    return _FAIL
+                result[key] = value
+            return result
+        return obj
+
+
+def compile_datetime():
+    def date_time(data):
+        if data is None or data == '':
+            return _FAIL
+        value = transform_datetime(data)
+        return _FAIL if value is None else value
+    return date_time
+
+
+def compile_decimal():
+    def to_decimal(data):
+        if data is None:
+            return _FAIL
+        if isinstance(data, (str, float, int)):
+            try:
+                return str(decimal.Decimal(str(data)))
+            except Exception: # pylint: disable=broad-except
+                return _FAIL
+        if isinstance(data, decimal.Decimal):
+            try:
+                return 'NaN' if data.is_snan() else str(data)
+            except Exception: # pylint: disable=broad-except
+                return _FAIL
+        return _FAIL
+    return to_decimal
+
+
+def convert_string(data):
+    if type(data) is str: # pylint: disable=unidiomatic-typecheck
+        return data
+    if data is None:
+        return _FAIL
+    if isinstance(data, (dict, list)):
+        # The Transformer stringifies these after filtering deselected fields out of them
+        raise _UseTransformer()
+    try:
+        return str(data)
+    except Exception: # pylint: disable=broad-except
+        return _FAIL
+
+
+def convert_number(data, number_type):
+    if isinstance(data, str):
+        data = data.replace(',', '')
+    try:
+        return number_type(data)
+    except Exception: # pylint: disable=broad-except
+        return _FAIL
+
+
+def convert_boolean(data):
+    if isinstance(data, str) and data.lower() == 'false':
+        return False
+    try:
+        return bool(data)
+    except Exception: # pylint: disable=broad-except
+        return _FAIL
+
+
+def get_schema_hash(schema, metadata):
+    metadata_items = sorted((list(breadcrumb), values) for breadcrumb, values in (metadata or {}).items())
+    serialized = json.dumps([schema, metadata_items], sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class CompiledTransformer():
+    '''
+    A drop-in replacement for `singer.Transformer` that compiles each schema
+    and its field selection into a converter once and reuses it for every
+    record. Records the compiled converter can't reproduce exactly, including
+    ones that don't match the schema, go through a `singer.Transformer`, so
+    output and errors are always the Transformer's.
+    '''
+    def __init__(self):
+        self.transformer = Transformer()
+        self._compiled = {}
+        self._converters = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.transformer.log_warning()
+
+    def get_converter(self, schema, metadata):
+        key = (id(schema), id(metadata))
+        cached = self._converters.get(key)
+        # Holding on to the schema and metadata keeps their ids from being reused
+        if cached is not None and cached[0] is schema and cached[1] is metadata:
+            return cached[2]
+
+        schema_hash = get_schema_hash(schema, metadata)
+        if schema_hash not in self._compiled:
+            compiler = _Compiler(metadata, self.transformer.removed, self.transformer.filtered)
+            try:
+                self._compiled[schema_hash] = compiler.compile(schema)
+            except CannotCompile as ex:
+                LOGGER.info('Using the generic transformer, schema cannot be compiled: %s', ex)
+                self._compiled[schema_hash] = None
+
+        converter = self._compiled[schema_hash]
+        self._converters[key] = (schema, metadata, converter)
+        return converter
+
+    def transform(self, data, schema, metadata=None):
+        converter = self.get_converter(schema, metadata)
+        if converter is not None:
+            try:
+                value = converter(data)
+                if value is not _FAIL:
+                    return value
+            except _UseTransformer:
+                pass
+        return self.transformer.transform(data, schema, metadata)
@@ -0,0 +1,69 @@
+import sqlite3
+
+import singer
+
+
+LOGGER = singer.get_logger()
+
+# Ids compared per query, under SQLite's default limit on bound parameters
+LOOKUP_BATCH_SIZE = 500
+
+
+class VersionIndex():
+    '''
+    A persistent map of object ids to the version last synced, kept in a
+    SQLite file so runs can tell which objects actually changed. Versions
+    recorded during a run are staged and only become part of the index on
+    `commit`, once the stream has finished; a run that fails leaves the index
+    as it was, so objects it wrote are compared against their old versions again.
+    '''
+    def __init__(self, path, name):
+        if not name.isidentifier():
+            raise ValueError('Invalid version index name {!r}'.format(name))
+        self._versions_table = '{}_versions'.format(name)
+        self._staged_table = '{}_staged'.format(name)
+        self._connection = sqlite3.connect(path)
+        with self._connection:
+            for table in [self._versions_table, self._staged_table]:
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY KEY, version TEXT NOT NULL)'.format(table))
+            # Versions staged by a run that didn't finish were never committed
+            self._connection.execute('DELETE FROM {}'.format(self._staged_table))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_changed(self, versions):
+        '''
+        Returns the ids in `versions`, a list of `(id, version)` pairs, whose version differs from the
+        index. Objects without a version can't be compared and are always returned.
+        '''
+        changed = []
+        for start in range(0, len(versions), LOOKUP_BATCH_SIZE):
+            batch = versions[start:start + LOOKUP_BATCH_SIZE]
+            rows = self._connection.execute(
+                'SELECT id, version FROM {} WHERE id IN ({})'.format(self._versions_table, ','.join('?' * len(batch))),
+                [object_id for object_id, _ in batch])
+            known = dict(rows)
+            changed.extend(object_id for object_id, version in batch
+                           if version is None or known.get(object_id) != str(version))
+        return changed
+
+    def stage(self, versions):
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO {} (id, version) VALUES (?, ?)'.format(self._staged_table),
+                [(object_id, str(version)) for object_id, version in versions if version is not None])
+
+    def commit(self):
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO {} (id, version) SELECT id, version FROM {}'.format(
+                    self._versions_table, self._staged_table))
+            self._connection.execute('DELETE FROM {}'.format(self._staged_table))
+
+    def close(self):
+        self._connection.close()
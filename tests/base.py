@@ -126,7 +126,9 @@ class TestSquareBaseParent:
             # Default values
             return_value = {
                 'start_date': dt.strftime(dt.utcnow() - timedelta(days=3), self.START_DATE_FORMAT),
-                'sandbox': 'true' if self.get_environment() == self.SANDBOX else 'false'
+                'sandbox': 'true' if self.get_environment() == self.SANDBOX else 'false',
+                # Re-reading older refunds would break the incremental bookmark assertions, the lookback has unit tests
+                'refunds_lookback_days': 0,
             }
 
             if not original:
@@ -224,7 +226,8 @@ class TestSquareBaseParent:
                 },
                 "refunds": {
                     self.PRIMARY_KEYS: {'id'},
-                    self.REPLICATION_METHOD: self.FULL,
+                    self.REPLICATION_METHOD: self.INCREMENTAL,
+                    self.REPLICATION_KEYS: {'created_at'},
                 },
                 "shifts": {
                     self.PRIMARY_KEYS: {'id'},
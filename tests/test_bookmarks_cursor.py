@@ -100,6 +100,9 @@ class TestSquareIncrementalReplicationCursor(TestSquareBaseParent.TestSquareBase
             }
             for testable_stream in testable_streams
         }
+        if 'shifts' in bookmarks:
+            # The tap only resumes shifts from a cursor of its newest first search
+            bookmarks['shifts']['cursor_sort_order'] = 'DESC'
         menagerie.set_state(conn_id, {"bookmarks": bookmarks})
 
         # run initial sync
@@ -309,7 +309,7 @@ class TestClient():
             "query": {
                 "sort": {
                     "field": "UPDATED_AT",
-                    "order": "ASC"
+                    "order": "DESC"
                 }
             }
         }
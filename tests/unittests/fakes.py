@@ -0,0 +1,27 @@
+import copy
+
+
+class FakeOutput():
+    '''Collects what a stream writes, in place of its `StreamOutput`.'''
+    def __init__(self):
+        self.records = []
+        self.checkpoints = []
+        self.states = []
+
+    def write_record(self, record):
+        self.records.append(record)
+
+    def checkpoint(self, state):
+        # Streams keep updating the same state dict, so keep it as it was
+        self.checkpoints.append(copy.deepcopy(state))
+
+    def write_state(self, state):
+        self.states.append(copy.deepcopy(state))
+
+    def get_checkpointed(self, tap_stream_id, key):
+        return [state['bookmarks'][tap_stream_id][key] for state in self.checkpoints]
+
+
+class FakeTransformer():
+    def transform(self, record, schema, metadata):
+        return record
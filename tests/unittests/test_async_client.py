@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tap_square.async_client import AsyncClientAdapter, AsyncSquareClient, aiohttp
+from tap_square.client import RetryableError
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class TestAsyncClientAdapter(unittest.TestCase):
+    def setUp(self):
+        self.sync_client = MagicMock()
+        self.async_client = AsyncSquareClient('token', 'sandbox')
+        self.adapter = AsyncClientAdapter(self.async_client, self.sync_client)
+
+    def tearDown(self):
+        self.adapter.close()
+
+    def test_pages_follow_cursors(self):
+        '''GET lists send the cursor as a query param and stop when no cursor is returned.'''
+        responses = [
+            {'payments': [{'id': 1}], 'cursor': 'next'},
+            {'payments': [{'id': 2}]},
+        ]
+        calls = []
+
+        async def fake_request(method, path, params=None, body=None):
+            calls.append((method, path, dict(params)))
+            return responses[len(calls) - 1]
+
+        with patch.object(self.async_client, '_request', side_effect=fake_request):
+            pages = list(self.adapter.get_payments('location_1', '2023-01-01T00:00:00Z', None))
+
+        self.assertEqual([([{'id': 1}], 'next'), ([{'id': 2}], None)], pages)
+        self.assertNotIn('cursor', calls[0][2])
+        self.assertEqual('next', calls[1][2]['cursor'])
+        self.assertEqual(('GET', '/v2/payments'), calls[1][:2])
+
+    def test_search_cursor_goes_in_body(self):
+        bodies = []
+
+        async def fake_request(method, path, params=None, body=None):
+            bodies.append(dict(body))
+            return {'orders': [], 'cursor': 'next'} if len(bodies) == 1 else {'orders': []}
+
+        with patch.object(self.async_client, '_request', side_effect=fake_request):
+            list(self.adapter.get_orders(['location_1'], '2023-01-01T00:00:00Z'))
+
+        self.assertNotIn('cursor', bodies[0])
+        self.assertEqual('next', bodies[1]['cursor'])
+
+    def test_missing_methods_fall_back_to_sync_client(self):
+        self.sync_client.access_token = 'token'
+        self.assertEqual('token', self.adapter.access_token)
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class TestAsyncClientRequest(unittest.IsolatedAsyncioTestCase):
+    '''Drives `_request` against a local server answering with each status.'''
+    async def asyncSetUp(self):
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+
+        self.responses = {
+            '/ok': web.json_response({'payments': [{'id': 1}]}),
+            '/throttled': web.json_response(
+                {'errors': [{'code': 'RATE_LIMITED'}]}, status=429, headers={'Retry-After': '3'}),
+            '/unavailable': web.Response(text='Service Unavailable', status=500),
+            '/bad_request': web.json_response({'errors': [{'code': 'BAD_REQUEST'}]}, status=400),
+        }
+
+        async def handler(request):
+            return self.responses[request.path]
+
+        app = web.Application()
+        app.router.add_route('*', '/{path}', handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        self.client = AsyncSquareClient('token', 'sandbox')
+        self.client._base_url = str(self.server.make_url(''))
+        rate_limiter_patcher = patch('tap_square.async_client.RATE_LIMITER')
+        self.rate_limiter = rate_limiter_patcher.start()
+        self.rate_limiter.reserve.return_value = 0
+        self.addCleanup(rate_limiter_patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def request(self, path):
+        # Skips the backoff decorator, so errors surface without being retried
+        return await AsyncSquareClient._request.__wrapped__(self.client, 'GET', path)
+
+    async def test_success_returns_the_body(self):
+        self.assertEqual({'payments': [{'id': 1}]}, await self.request('/ok'))
+        self.rate_limiter.on_success.assert_called_once_with()
+
+    async def test_throttled_requests_slow_the_rate_limiter_and_are_retried(self):
+        with self.assertRaises(RetryableError):
+            await self.request('/throttled')
+        self.rate_limiter.on_throttle.assert_called_once_with(3.0)
+
+    async def test_server_errors_are_retried(self):
+        with self.assertRaises(RetryableError) as context:
+            await self.request('/unavailable')
+        self.assertEqual('Service Unavailable', str(context.exception))
+        self.rate_limiter.on_throttle.assert_not_called()
+
+    async def test_client_errors_are_not_retried(self):
+        with self.assertRaises(RuntimeError) as context:
+            await self.request('/bad_request')
+        self.assertEqual([{'code': 'BAD_REQUEST'}], context.exception.args[0])
@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tap_square.discover import CATALOG_CACHE_PATH, build_catalog, get_abs_path, load_catalog_cache, write_catalog_cache
+
+
+class TestCatalogCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'catalog_cache.json')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cache_matches_live_discovery(self):
+        write_catalog_cache(self.path)
+
+        for sandbox in [True, False]:
+            # The cache went through JSON, so compare the serialized forms
+            self.assertEqual(
+                json.loads(json.dumps(build_catalog(sandbox))),
+                load_catalog_cache(sandbox, self.path),
+            )
+
+    def test_sandbox_cache_excludes_production_only_streams(self):
+        write_catalog_cache(self.path)
+        streams = {stream['tap_stream_id'] for stream in load_catalog_cache(True, self.path)['streams']}
+        self.assertNotIn('payouts', streams)
+        self.assertNotIn('bank_accounts', streams)
+
+    def test_stale_cache_is_ignored(self):
+        write_catalog_cache(self.path)
+        with open(self.path) as file:
+            cache = json.load(file)
+        cache['hash'] = 'schemas have changed since'
+        with open(self.path, 'w') as file:
+            json.dump(cache, file)
+
+        self.assertIsNone(load_catalog_cache(False, self.path))
+
+    def test_schema_edits_of_the_same_length_make_the_cache_stale(self):
+        write_catalog_cache(self.path)
+        schemas_dir = os.path.join(self.tmp_dir.name, 'schemas')
+        shutil.copytree(get_abs_path('schemas'), schemas_dir)
+        schema_path = os.path.join(schemas_dir, 'refunds.json')
+        with open(schema_path) as file:
+            schema = file.read()
+        with open(schema_path, 'w') as file:
+            file.write(schema.replace('"integer"', '"boolean"', 1))
+
+        with patch('tap_square.discover.get_abs_path', lambda path: os.path.join(self.tmp_dir.name, path)):
+            self.assertIsNone(load_catalog_cache(False, self.path))
+
+    def test_missing_cache_is_ignored(self):
+        self.assertIsNone(load_catalog_cache(False, self.path))
+
+    def test_shipped_cache_is_up_to_date(self):
+        for sandbox in [True, False]:
+            self.assertEqual(
+                json.loads(json.dumps(build_catalog(sandbox))),
+                load_catalog_cache(sandbox, CATALOG_CACHE_PATH),
+                'Regenerate the catalog cache with '
+                '`python -c "from tap_square.discover import write_catalog_cache; write_catalog_cache()"`',
+            )
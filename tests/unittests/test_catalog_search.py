@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_square.catalog_search import SharedCatalogClient
+
+
+def make_object(object_type, object_id, updated_at):
+    return {'type': object_type, 'id': object_id, 'updated_at': updated_at}
+
+
+class TestSharedCatalogClient(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.get_catalog_objects.return_value = iter([
+            ([make_object('ITEM', 'item_1', '2023-01-01T00:00:00.000Z'),
+              make_object('TAX', 'tax_1', '2023-01-02T00:00:00.000Z')], 'next'),
+            ([make_object('ITEM', 'item_2', '2023-01-03T00:00:00.000Z'),
+              make_object('TAX', 'tax_2', '2023-01-04T00:00:00.000Z')], None),
+        ])
+        self.shared_client = SharedCatalogClient(self.client, {
+            'ITEM': '2023-01-01T00:00:00.000000Z',
+            'TAX': '2023-01-03T00:00:00Z',
+        })
+
+    def tearDown(self):
+        self.shared_client.close()
+
+    def get_ids(self, object_type, start_time):
+        return [record['id'] for page, _ in self.shared_client.get_catalog(object_type, start_time) for record in page]
+
+    def test_one_search_serves_every_type(self):
+        self.assertEqual(['item_1', 'item_2'], self.get_ids('ITEM', '2023-01-01T00:00:00.000000Z'))
+        self.assertEqual(['tax_2'], self.get_ids('TAX', '2023-01-03T00:00:00Z'))
+
+        self.client.get_catalog_objects.assert_called_once_with(['ITEM', 'TAX'], '2023-01-01T00:00:00.000000Z')
+        self.client.get_catalog.assert_not_called()
+
+    def test_other_types_use_their_own_search(self):
+        self.client.get_catalog.return_value = iter([([make_object('DISCOUNT', 'discount_1', '2023-01-01T00:00:00Z')], None)])
+        self.assertEqual(['discount_1'], self.get_ids('DISCOUNT', '2023-01-01T00:00:00Z'))
+        self.client.get_catalog_objects.assert_not_called()
+
+    def test_other_methods_go_to_the_client(self):
+        self.client.get_locations.return_value = iter([])
+        list(self.shared_client.get_locations())
+        self.client.get_locations.assert_called_once_with()
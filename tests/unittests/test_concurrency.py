@@ -0,0 +1,94 @@
+import time
+import unittest
+
+from tap_square.concurrency import ordered_parallel_pages, prefetch
+
+
+def make_task(key, page_count, delay):
+    def task():
+        for page_number in range(page_count):
+            time.sleep(delay)
+            yield '{}-{}'.format(key, page_number)
+    return task
+
+
+class TestOrderedParallelPages(unittest.TestCase):
+    def test_pages_are_yielded_in_task_order(self):
+        '''Slow early tasks must not let later tasks' pages jump ahead.'''
+        tasks = [
+            (key, make_task(key, 3, delay))
+            for key, delay in [('a', 0.03), ('b', 0.0), ('c', 0.01), ('d', 0.0)]
+        ]
+
+        pages = list(ordered_parallel_pages(tasks, max_workers=3))
+
+        self.assertEqual(
+            [('a', 'a-0'), ('a', 'a-1'), ('a', 'a-2'),
+             ('b', 'b-0'), ('b', 'b-1'), ('b', 'b-2'),
+             ('c', 'c-0'), ('c', 'c-1'), ('c', 'c-2'),
+             ('d', 'd-0'), ('d', 'd-1'), ('d', 'd-2')],
+            pages,
+        )
+
+    def test_serial_when_one_worker(self):
+        tasks = [('a', make_task('a', 2, 0)), ('b', make_task('b', 1, 0))]
+        self.assertEqual(
+            [('a', 'a-0'), ('a', 'a-1'), ('b', 'b-0')],
+            list(ordered_parallel_pages(tasks, max_workers=1)),
+        )
+
+    def test_task_error_is_raised_in_consumer(self):
+        def failing_task():
+            yield 'ok'
+            raise RuntimeError('boom')
+
+        pages = ordered_parallel_pages([('a', failing_task), ('b', make_task('b', 5, 0))], max_workers=2)
+        self.assertEqual(('a', 'ok'), next(pages))
+        with self.assertRaises(RuntimeError):
+            next(pages)
+
+    def test_consumer_stopping_early_releases_workers(self):
+        tasks = [(key, make_task(key, 50, 0)) for key in 'abcd']
+        pages = ordered_parallel_pages(tasks, max_workers=4, queue_depth=1)
+        next(pages)
+        # Closing must not hang on workers blocked on their full queues
+        pages.close()
+
+
+class TestPrefetch(unittest.TestCase):
+    def test_next_page_is_fetched_while_current_page_is_processed(self):
+        fetched = []
+
+        def pages():
+            for page_number in range(3):
+                fetched.append(page_number)
+                yield page_number
+
+        prefetched = prefetch(pages(), depth=1)
+        self.assertEqual(0, next(prefetched))
+        time.sleep(0.05)
+        # Page 1 is queued and page 2 is being fetched while page 0 is still being processed
+        self.assertEqual([0, 1, 2], fetched)
+        self.assertEqual([1, 2], list(prefetched))
+
+    def test_errors_are_raised_after_earlier_pages(self):
+        def pages():
+            yield 'first'
+            raise RuntimeError('boom')
+
+        prefetched = prefetch(pages(), depth=2)
+        self.assertEqual('first', next(prefetched))
+        with self.assertRaises(RuntimeError):
+            next(prefetched)
+
+    def test_zero_depth_does_not_prefetch(self):
+        fetched = []
+
+        def pages():
+            for page_number in range(3):
+                fetched.append(page_number)
+                yield page_number
+
+        prefetched = prefetch(pages(), depth=0)
+        self.assertEqual(0, next(prefetched))
+        self.assertEqual([0], fetched)
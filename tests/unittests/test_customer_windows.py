@@ -0,0 +1,95 @@
+import math
+import random
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import singer
+
+from tap_square.streams import Customers, DateWindows
+from fakes import FakeOutput, FakeTransformer
+
+
+START_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+BUSY_START = datetime(2022, 11, 1, tzinfo=timezone.utc)
+NOW = datetime(2023, 1, 1, tzinfo=timezone.utc)
+PAGE_SIZE = 100
+
+
+def customers_between(start, end):
+    '''A small merchant's years of history followed by two busy months: a few customers a week, then 400 a day'''
+    def count_until(moment):
+        quiet_days = (min(moment, BUSY_START) - START_DATE).total_seconds() / 86400
+        busy_days = max(0, (moment - BUSY_START).total_seconds() / 86400)
+        return quiet_days * 5 / 7 + busy_days * 400
+    return int(count_until(end)) - int(count_until(start))
+
+
+class FakeClient():
+    def __init__(self):
+        self.requests = 0
+        self.pages_per_window = []
+
+    def get_customers(self, start_time, end_time):
+        count = customers_between(singer.utils.strptime_to_utc(start_time), singer.utils.strptime_to_utc(end_time))
+        self.pages_per_window.append(0)
+        for page_number in range(max(1, math.ceil(count / PAGE_SIZE))):
+            self.requests += 1
+            self.pages_per_window[-1] += 1
+            yield ([{}] * min(PAGE_SIZE, count - page_number * PAGE_SIZE), None)
+
+
+class SlowClient():
+    '''Returns each window's start as its records, taking a random time over each page'''
+    def get_customers(self, start_time, end_time):
+        for page_number in range(3):
+            time.sleep(random.random() / 500)
+            yield ([{'window': start_time, 'page': page_number}], None)
+
+
+@patch('singer.utils.now', return_value=NOW)
+class TestCustomerWindows(unittest.TestCase):
+    def sync(self, config, client=None):
+        client = client or FakeClient()
+        output = FakeOutput()
+        config = dict(config, start_date=singer.utils.strftime(START_DATE))
+        state = Customers(client, config, output).sync({}, {}, {}, config, FakeTransformer())
+        return client, output, state
+
+    def test_windows_cover_the_range_without_gaps(self, mock_now):
+        windows = DateWindows('2023-01-01T00:00:00Z', min_days=1, max_days=30)
+        mock_now.return_value = datetime(2023, 3, 1, tzinfo=timezone.utc)
+        previous_end = '2023-01-01T00:00:00.000000Z'
+        for window_start, window_end in windows:
+            self.assertEqual(previous_end, window_start)
+            windows.observe(0, 1)
+            previous_end = window_end
+        self.assertEqual('2023-03-01T00:00:00.000000Z', previous_end)
+
+    def test_benchmark_against_fixed_windows(self, mock_now):
+        fixed_client, fixed_output, fixed_state = self.sync({})
+        adaptive_client, adaptive_output, adaptive_state = self.sync({'adaptive_customer_windows': True})
+
+        # Both read every customer and end at the same bookmark
+        self.assertEqual(len(fixed_output.records), len(adaptive_output.records))
+        self.assertEqual(fixed_state, adaptive_state)
+
+        # Fixed windows: 392 requests in 157 windows, up to 28 pages per window.
+        # Adaptive windows: 375 requests in 65 windows. The quiet years take a few requests,
+        # and a window is split once it goes past 10 pages, so cursor chains stay short.
+        self.assertLess(adaptive_client.requests, fixed_client.requests)
+        self.assertLessEqual(max(adaptive_client.pages_per_window), 11)
+        self.assertGreater(max(fixed_client.pages_per_window), 20)
+
+    def test_parallel_windows_are_written_in_order(self, mock_now):
+        mock_now.return_value = datetime(2020, 6, 1, tzinfo=timezone.utc)
+        _, serial_output, serial_state = self.sync({}, SlowClient())
+        _, parallel_output, parallel_state = self.sync({'customers_window_concurrency': 4}, SlowClient())
+
+        self.assertEqual(serial_output.records, parallel_output.records)
+        # Each bookmark is the end of a window whose records, and all before it, have been written
+        self.assertEqual(
+            serial_output.get_checkpointed('customers', 'updated_at'),
+            parallel_output.get_checkpointed('customers', 'updated_at'))
+        self.assertEqual(serial_state, parallel_state)
@@ -0,0 +1,43 @@
+import logging
+import subprocess
+import sys
+import unittest
+
+# Modules only syncing needs; loading them for discovery is a startup regression
+SYNC_ONLY_MODULES = {'square', 'aiohttp', 'tap_square.client', 'tap_square.sync', 'tap_square.async_client'}
+
+LOGGER = logging.getLogger(__name__)
+
+
+def import_times(code):
+    '''
+    Runs `code` under `python -X importtime` and returns {module: cumulative microseconds}
+    '''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_discovery_does_not_load_sync_modules(self):
+        times = import_times('from tap_square.discover import discover; import tap_square; discover(False)')
+
+        self.assertIn('tap_square', times)
+        self.assertEqual(set(), SYNC_ONLY_MODULES.intersection(times))
+        # Timings vary too much between machines to assert on, but are shown with a failure
+        LOGGER.info('tap_square imports in %.1fms', times['tap_square'] / 1000)
+
+    def test_sync_modules_still_import(self):
+        times = import_times('import tap_square.sync')
+        self.assertIn('square.client', times)
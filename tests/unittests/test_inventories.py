@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_square.streams import Inventories
+from fakes import FakeOutput, FakeTransformer
+
+
+class TestPartitionedInventories(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            'start_date': '2023-01-01T00:00:00Z',
+            'partition_inventories_by_location': True,
+            'location_concurrency': 2,
+            'incremental_inventories': True,
+        }
+        self.calls = []
+
+    def get_inventories(self, start_time, bookmarked_cursor, location_ids):
+        self.calls.append((location_ids, bookmarked_cursor))
+        location_id = location_ids[0]
+        if bookmarked_cursor is None:
+            yield [{'location_id': location_id, 'page': 1}], 'next'
+            if location_id == 'location_3':
+                raise RuntimeError('boom')
+        yield [{'location_id': location_id, 'page': 2}], None
+
+    def sync(self, state):
+        client = MagicMock()
+        client.get_locations.return_value = iter([([{'id': 'location_1'}, {'id': 'location_2'}, {'id': 'location_3'}], None)])
+        client.get_inventories.side_effect = self.get_inventories
+        output = FakeOutput()
+        try:
+            state = Inventories(client, self.config, output).sync(state, {}, {}, self.config, FakeTransformer())
+        except RuntimeError:
+            pass
+        return output, state
+
+    def test_partitions_resume_from_their_progress(self):
+        output, state = self.sync({})
+
+        self.assertEqual(
+            [('location_1', 1), ('location_1', 2), ('location_2', 1), ('location_2', 2), ('location_3', 1)],
+            [(record['location_id'], record['page']) for record in output.records])
+        # The failing partition's cursor is cleared so it starts over
+        progress = state['bookmarks']['inventories']
+        sync_start = progress.pop('sync_start')
+        self.assertEqual({'completed_location_ids': ['location_1', 'location_2'], 'location_id': 'location_3'}, progress)
+        progress['sync_start'] = sync_start
+
+        self.calls = []
+        state['bookmarks']['inventories']['cursor'] = 'next'
+        output, state = self.sync(state)
+        self.assertEqual([(['location_3'], 'next')], self.calls)
+        # Once finished the bookmark is when the failed sync started
+        self.assertEqual({'calculated_at': sync_start}, state['bookmarks']['inventories'])
+
+    def test_unpartitioned_by_default(self):
+        del self.config['partition_inventories_by_location']
+        client = MagicMock()
+        client.get_inventories.return_value = iter([([{'id': 1}], None)])
+        output = FakeOutput()
+        Inventories(client, self.config, output).sync({}, {}, {}, self.config, FakeTransformer())
+        client.get_inventories.assert_called_once_with('2023-01-01T00:00:00Z', None)
+
+
+class TestIncrementalInventories(unittest.TestCase):
+    def test_full_table_by_default(self):
+        config = {'start_date': '2023-01-01T00:00:00Z'}
+        client = MagicMock()
+        client.get_inventories.return_value = iter([([{'id': 1}], 'next'), ([{'id': 2}], None)])
+        output = FakeOutput()
+
+        state = Inventories(client, config, output).sync({}, {}, {}, config, FakeTransformer())
+
+        self.assertEqual(2, len(output.records))
+        self.assertEqual({}, state['bookmarks']['inventories'])
+
+    def test_counts_are_retrieved_from_the_bookmark(self):
+        config = {'start_date': '2023-01-01T00:00:00Z', 'incremental_inventories': True}
+        state = {'bookmarks': {'inventories': {'calculated_at': '2023-02-01T00:00:00Z'}}}
+        client = MagicMock()
+        client.get_inventories.return_value = iter([([{'id': 1}], 'next'), ([{'id': 2}], None)])
+        output = FakeOutput()
+
+        state = Inventories(client, config, output).sync(state, {}, {}, config, FakeTransformer())
+
+        client.get_inventories.assert_called_once_with('2023-02-01T00:00:00Z', None)
+        self.assertEqual(['calculated_at'], list(state['bookmarks']['inventories']))
+        self.assertGreater(state['bookmarks']['inventories']['calculated_at'], '2023-02-01T00:00:00Z')
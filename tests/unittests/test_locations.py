@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_square.streams import CashDrawerShifts, Locations
+
+
+LOCATIONS = [
+    {'id': 'L1', 'status': 'ACTIVE', 'timezone': 'UTC'},
+    {'id': 'L2', 'status': 'INACTIVE', 'timezone': 'UTC'},
+    {'id': 'L3', 'status': 'ACTIVE', 'timezone': 'UTC'},
+]
+
+
+def get_client():
+    client = MagicMock()
+    client.get_locations.side_effect = lambda: iter([(list(LOCATIONS), None)])
+    client.get_cash_drawer_shifts.side_effect = lambda location_id, start_time, cursor: iter([([{'id': location_id}], None)])
+    return client
+
+
+class TestLocations(unittest.TestCase):
+    def test_locations_are_fetched_once_for_the_stream_and_the_location_ids(self):
+        client = get_client()
+
+        pages = list(Locations(client).get_pages(None, None))
+        location_ids = Locations.get_all_location_ids(client)
+
+        self.assertEqual([(LOCATIONS, None)], pages)
+        self.assertEqual(['L1', 'L2', 'L3'], location_ids)
+        client.get_locations.assert_called_once_with()
+
+    def test_inactive_locations_are_skipped_when_configured(self):
+        client = get_client()
+
+        all_pages = [page for page, _ in CashDrawerShifts(client, {}).get_pages(None, None)]
+        active_pages = [page for page, _ in CashDrawerShifts(client, {'skip_inactive_locations': 'true'}).get_pages(None, None)]
+
+        self.assertEqual([[{'id': 'L1'}], [{'id': 'L2'}], [{'id': 'L3'}]], all_pages)
+        self.assertEqual([[{'id': 'L1'}], [{'id': 'L3'}]], active_pages)
+        client.get_locations.assert_called_once_with()
+
+    def test_changes_to_the_written_locations_leave_the_shared_ones_alone(self):
+        client = get_client()
+
+        for page, _ in Locations(client).get_pages(None, None):
+            for location in page:
+                # As the transformer does with deselected fields
+                del location['status']
+
+        self.assertEqual(['L1', 'L3'], Locations.get_all_location_ids(client, skip_inactive=True))
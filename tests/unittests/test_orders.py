@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from tap_square.streams import Orders, get_chunk_key
+from fakes import FakeOutput, FakeTransformer
+
+
+LOCATION_IDS = ['location_{:02}'.format(number) for number in range(15)]
+
+
+def get_orders(location_ids, start_time):
+    # The second chunk's orders are all older than the first chunk's
+    updated_at = '2023-01-05T00:00:00.000Z' if location_ids[0] == 'location_00' else '2023-01-02T00:00:00.000Z'
+    yield ([{'id': location_ids[0], 'updated_at': updated_at}], None)
+
+
+class TestOrders(unittest.TestCase):
+    def sync(self, state, concurrency=1, **config):
+        client = MagicMock()
+        client.get_locations.return_value = iter([([{'id': location_id} for location_id in LOCATION_IDS], None)])
+        client.get_orders.side_effect = get_orders
+        config = dict(config, start_date='2023-01-01T00:00:00Z', location_concurrency=concurrency)
+        output = FakeOutput()
+        state = Orders(client, config, output).sync(state, {}, {}, config, FakeTransformer())
+        return client, output, state
+
+    def test_chunks_keep_their_own_bookmarks_until_every_chunk_is_done(self):
+        _, output, state = self.sync({}, concurrency=2)
+
+        self.assertEqual(['location_00', 'location_10'], [record['id'] for record in output.records])
+        self.assertEqual(
+            [{get_chunk_key(LOCATION_IDS[:10]): '2023-01-05T00:00:00.000Z'},
+             {get_chunk_key(LOCATION_IDS[:10]): '2023-01-05T00:00:00.000Z',
+              get_chunk_key(LOCATION_IDS[10:]): '2023-01-02T00:00:00.000Z'}],
+            [checkpoint['bookmarks']['orders']['chunk_bookmarks'] for checkpoint in output.checkpoints[:2]])
+        # Once finished only the stream bookmark is kept
+        self.assertEqual({'updated_at': '2023-01-05T00:00:00.000Z'}, state['bookmarks']['orders'])
+
+    def test_each_chunk_resumes_from_its_own_bookmark(self):
+        state = {'bookmarks': {'orders': {
+            'updated_at': '2023-01-01T00:00:00.000Z',
+            # Keys don't depend on the order of the locations
+            'chunk_bookmarks': {get_chunk_key(list(reversed(LOCATION_IDS[:10]))): '2023-01-05T00:00:00.000Z'},
+        }}}
+        client, _, state = self.sync(state)
+
+        self.assertEqual(
+            [(LOCATION_IDS[:10], '2023-01-05T00:00:00.000Z'),
+             (LOCATION_IDS[10:], '2023-01-01T00:00:00.000Z')],
+            [call.args for call in client.get_orders.call_args_list])
+        self.assertEqual({'updated_at': '2023-01-05T00:00:00.000Z'}, state['bookmarks']['orders'])
+
+    def test_a_failed_backfill_resumes_unfinished_chunks_from_the_start_date(self):
+        def fail_on_second_chunk(location_ids, start_time):
+            if location_ids[0] == 'location_10':
+                raise RuntimeError('Request failed')
+            yield from get_orders(location_ids, start_time)
+
+        state = {}
+        client = MagicMock()
+        client.get_locations.return_value = iter([([{'id': location_id} for location_id in LOCATION_IDS], None)])
+        client.get_orders.side_effect = fail_on_second_chunk
+        config = {'start_date': '2023-01-01T00:00:00Z'}
+        with self.assertRaises(RuntimeError):
+            Orders(client, config, FakeOutput()).sync(state, {}, {}, config, FakeTransformer())
+        # The stream bookmark waits for every chunk
+        self.assertNotIn('updated_at', state['bookmarks']['orders'])
+
+        client, _, _ = self.sync(state)
+        self.assertEqual(
+            ['2023-01-05T00:00:00.000Z', '2023-01-01T00:00:00Z'],
+            [call.args[1] for call in client.get_orders.call_args_list])
+
+    def test_old_state_resumes_every_chunk_from_the_stream_bookmark(self):
+        client, _, _ = self.sync({'bookmarks': {'orders': {'updated_at': '2023-01-03T00:00:00Z'}}})
+        self.assertEqual(
+            ['2023-01-03T00:00:00Z', '2023-01-03T00:00:00Z'],
+            [call.args[1] for call in client.get_orders.call_args_list])
+
+
+class TestOrdersVersionIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = {
+            'start_date': '2023-01-01T00:00:00Z',
+            'orders_version_index_path': os.path.join(self.directory.name, 'index.db'),
+        }
+        self.orders = {
+            'a': {'id': 'a', 'version': 1, 'updated_at': '2023-01-02T00:00:00.000Z'},
+            'b': {'id': 'b', 'version': 3, 'updated_at': '2023-01-03T00:00:00.000Z'},
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def sync(self, state):
+        client = MagicMock()
+        client.get_locations.return_value = iter([([{'id': 'location'}], None)])
+        client.get_orders.return_value = iter([(list(self.orders.values()), None)])
+        client.get_order_entries.return_value = iter([(
+            [{'order_id': order['id'], **({'version': order['version']} if 'version' in order else {})}
+             for order in self.orders.values()], None)])
+        client.batch_retrieve_orders.side_effect = lambda order_ids: [self.orders[order_id] for order_id in order_ids]
+        output = FakeOutput()
+        state = Orders(client, self.config, output).sync(state, {}, {}, self.config, FakeTransformer())
+        return client, output, state
+
+    def test_only_changed_orders_are_retrieved(self):
+        # Without a bookmark everything is synced, building the index
+        client, output, state = self.sync({})
+        client.get_order_entries.assert_not_called()
+        self.assertEqual(['a', 'b'], [record['id'] for record in output.records])
+
+        self.orders['b'] = dict(self.orders['b'], version=4, updated_at='2023-01-04T00:00:00.000Z')
+        client, output, state = self.sync(state)
+        client.batch_retrieve_orders.assert_called_once_with(['b'])
+        self.assertEqual(['b'], [record['id'] for record in output.records])
+        self.assertEqual('2023-01-04T00:00:00.000Z', state['bookmarks']['orders']['updated_at'])
+
+    def test_orders_without_a_version_are_always_retrieved(self):
+        # Orders not created through the API have no version
+        del self.orders['a']['version']
+        _, _, state = self.sync({})
+
+        client, output, _ = self.sync(state)
+        client.batch_retrieve_orders.assert_called_once_with(['a'])
+        self.assertEqual(['a'], [record['id'] for record in output.records])
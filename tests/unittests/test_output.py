@@ -0,0 +1,119 @@
+import decimal
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import singer
+
+from tap_square.output import Output, StreamOutput, serialize_message
+
+
+class TestSerializeMessage(unittest.TestCase):
+    def test_matches_singer_serialization(self):
+        message = singer.RecordMessage(stream='orders', record={'id': 'a', 'total': 1.5, 'name': 'Ünïcode', 'n': None})
+        self.assertEqual(
+            json.loads(singer.format_message(message)),
+            json.loads(serialize_message(message)),
+        )
+        self.assertTrue(serialize_message(message).endswith(b'\n'))
+
+    def test_decimals_fall_back_to_singer(self):
+        message = singer.RecordMessage(stream='orders', record={'amount': decimal.Decimal('1.10')})
+        self.assertEqual(b'{"type": "RECORD", "stream": "orders", "record": {"amount": 1.10}}\n', serialize_message(message))
+
+
+class TestOutput(unittest.TestCase):
+    def test_unbuffered_writes_every_message(self):
+        stdout = io.StringIO()
+        output = Output()
+        with redirect_stdout(stdout):
+            output.write_record('orders', {'id': 1})
+            self.assertEqual(1, len(stdout.getvalue().splitlines()))
+
+    @patch('tap_square.output.time.monotonic', return_value=0)
+    def test_buffered_records_are_flushed_with_state(self, mock_monotonic):
+        stdout = io.StringIO()
+        output = Output(buffer_size=10000, flush_interval=60)
+        with redirect_stdout(stdout):
+            output.write_record('orders', {'id': 1})
+            output.write_record('orders', {'id': 2})
+            self.assertEqual('', stdout.getvalue())
+
+            output.write_state({'bookmarks': {'orders': {'updated_at': 'x'}}})
+
+        messages = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(['RECORD', 'RECORD', 'STATE'], [message['type'] for message in messages])
+
+    @patch('tap_square.output.time.monotonic', return_value=0)
+    def test_buffer_is_flushed_when_full(self, mock_monotonic):
+        stdout = io.StringIO()
+        output = Output(buffer_size=100, flush_interval=60)
+        with redirect_stdout(stdout):
+            for record_id in range(10):
+                output.write_record('orders', {'id': record_id})
+        # Each record is about 50 bytes, so every second record fills the buffer
+        self.assertEqual(10, len(stdout.getvalue().splitlines()))
+
+    def test_buffer_is_flushed_after_interval(self):
+        stdout = io.StringIO()
+        output = Output(buffer_size=10000, flush_interval=5)
+        with redirect_stdout(stdout), patch('tap_square.output.time.monotonic', return_value=0):
+            output.flush()
+            output.write_record('orders', {'id': 1})
+            self.assertEqual('', stdout.getvalue())
+        with redirect_stdout(stdout), patch('tap_square.output.time.monotonic', return_value=6):
+            output.write_record('orders', {'id': 2})
+        self.assertEqual(2, len(stdout.getvalue().splitlines()))
+
+
+class FakeOutput():
+    def __init__(self):
+        self.lock = None
+        self.states = []
+
+    def write_record(self, stream, record):
+        pass
+
+    def write_state(self, state):
+        self.states.append(state)
+
+
+class TestStreamOutputCheckpoints(unittest.TestCase):
+    def test_every_checkpoint_is_written_without_a_policy(self):
+        output = FakeOutput()
+        stream_output = StreamOutput(output, 'orders')
+        for page in range(3):
+            stream_output.checkpoint({'page': page})
+        self.assertEqual([{'page': 0}, {'page': 1}, {'page': 2}], output.states)
+
+    def test_checkpoints_are_coalesced_by_record_count(self):
+        output = FakeOutput()
+        stream_output = StreamOutput(output, 'orders', checkpoint_records=5)
+        for page in range(6):
+            for _ in range(2):
+                stream_output.write_record({'id': page})
+            stream_output.checkpoint({'page': page})
+        self.assertEqual([{'page': 2}, {'page': 5}], output.states)
+
+    @patch('tap_square.output.time.monotonic')
+    def test_checkpoints_are_coalesced_by_time(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        output = FakeOutput()
+        stream_output = StreamOutput(output, 'orders', checkpoint_seconds=10)
+        stream_output.checkpoint({'page': 0})
+        mock_monotonic.return_value = 11
+        stream_output.checkpoint({'page': 1})
+        self.assertEqual([{'page': 1}], output.states)
+
+    def test_pending_checkpoint_is_a_snapshot(self):
+        output = FakeOutput()
+        stream_output = StreamOutput(output, 'orders', checkpoint_records=100)
+        state = {'bookmarks': {'orders': {'updated_at': 'a'}}}
+        stream_output.checkpoint(state)
+        state['bookmarks']['orders']['updated_at'] = 'b'
+
+        stream_output.write_pending_state()
+        stream_output.write_pending_state()
+        self.assertEqual([{'bookmarks': {'orders': {'updated_at': 'a'}}}], output.states)
@@ -0,0 +1,105 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import singer
+from singer.catalog import Catalog
+
+from tap_square.streams import STREAMS, Stream
+from tap_square.sync import sync
+
+
+class FakeStream(Stream):
+    key_properties = ['id']
+    replication_key = 'updated_at'
+    page_count = 3
+
+    def sync(self, state, stream_schema, stream_metadata, config, transformer):
+        for page_number in range(self.page_count):
+            record = {'id': page_number, 'updated_at': '2023-01-0{}T00:00:00Z'.format(page_number + 1)}
+            self.output.write_record(record)
+            state = singer.write_bookmark(state, self.tap_stream_id, self.replication_key, record['updated_at'])
+            self.output.checkpoint(state)
+        return state
+
+
+class FakeOrders(FakeStream):
+    tap_stream_id = 'orders'
+    estimated_cost = 10
+
+
+class FakeTaxes(FakeStream):
+    tap_stream_id = 'taxes'
+    page_count = 2
+
+
+class FailingTaxes(FakeTaxes):
+    def sync(self, state, stream_schema, stream_metadata, config, transformer):
+        state = super().sync(state, stream_schema, stream_metadata, config, transformer)
+        raise RuntimeError('boom')
+
+
+FAKE_STREAMS = {'orders': FakeOrders, 'taxes': FakeTaxes}
+
+
+def make_catalog():
+    streams = []
+    for tap_stream_id in ['taxes', 'orders']:
+        streams.append({
+            'stream': tap_stream_id,
+            'tap_stream_id': tap_stream_id,
+            'schema': {'type': 'object', 'properties': {'id': {'type': 'integer'}}},
+            'metadata': [{'breadcrumb': [], 'metadata': {'selected': True}}],
+        })
+    return Catalog.from_dict({'streams': streams})
+
+
+class TestParallelSync(unittest.TestCase):
+    @patch('tap_square.sync.SquareClient')
+    def test_parallel_sync_merges_bookmarks(self, mock_client):
+        config = {'max_parallel_streams': 2}
+        state = {'bookmarks': {'locations': {'cursor': 'abc'}}}
+        stdout = io.StringIO()
+
+        with patch.dict(STREAMS, FAKE_STREAMS, clear=True), redirect_stdout(stdout):
+            sync(config, 'config_path', state, make_catalog())
+
+        messages = [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+        # Each stream's SCHEMA precedes its RECORDs and RECORDs arrive in order
+        for tap_stream_id, page_count in [('orders', 3), ('taxes', 2)]:
+            stream_messages = [message for message in messages if message.get('stream') == tap_stream_id]
+            self.assertEqual('SCHEMA', stream_messages[0]['type'])
+            self.assertEqual(list(range(page_count)), [message['record']['id'] for message in stream_messages[1:]])
+
+        self.assertEqual(
+            {
+                'currently_syncing': None,
+                'bookmarks': {
+                    'locations': {'cursor': 'abc'},
+                    'orders': {'updated_at': '2023-01-03T00:00:00Z'},
+                    'taxes': {'updated_at': '2023-01-02T00:00:00Z'},
+                },
+            },
+            messages[-1]['value'],
+        )
+
+
+class TestStateCheckpoints(unittest.TestCase):
+    @patch('tap_square.sync.SquareClient')
+    def test_final_state_is_written_when_a_stream_fails(self, mock_client):
+        config = {'state_checkpoint_records': 1000}
+        stdout = io.StringIO()
+
+        with patch.dict(STREAMS, {'taxes': FailingTaxes}, clear=True), redirect_stdout(stdout):
+            with self.assertRaises(RuntimeError):
+                sync(config, 'config_path', {}, make_catalog())
+
+        states = [json.loads(line)['value'] for line in stdout.getvalue().splitlines() if '"STATE"' in line]
+        # Only the checkpoint held back by the policy is written, once the stream fails
+        self.assertEqual(
+            [{'currently_syncing': 'taxes', 'bookmarks': {'taxes': {'updated_at': '2023-01-02T00:00:00Z'}}}],
+            states[1:],
+        )
@@ -0,0 +1,131 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_square.streams import Payments, get_time_slices
+from fakes import FakeOutput, FakeTransformer
+
+
+PAGES = {
+    (location_id, cursor): ([{'id': '{}-{}'.format(location_id, cursor), 'updated_at': updated_at}], next_cursor)
+    for location_id, cursor, updated_at, next_cursor in [
+        ('location_1', None, '2023-01-02T00:00:00.000Z', None),
+        ('location_2', None, '2023-01-03T00:00:00.000Z', 'page_2'),
+        ('location_2', 'page_2', '2023-01-04T00:00:00.000Z', None),
+        ('location_3', None, '2023-01-02T00:00:00.000Z', None),
+    ]
+}
+
+
+class TestPaymentsProgress(unittest.TestCase):
+    def setUp(self):
+        self.config = {'start_date': '2023-01-01T00:00:00Z', 'location_concurrency': 2}
+        self.calls = []
+
+    def get_payments(self, location_id, start_time, bookmarked_cursor, end_time):
+        self.calls.append((location_id, bookmarked_cursor, end_time))
+        if location_id == 'location_3' and self.fail:
+            raise RuntimeError('boom')
+        page, cursor = PAGES[(location_id, bookmarked_cursor)]
+        yield page, cursor
+        if cursor:
+            yield from self.get_payments(location_id, start_time, cursor, end_time)
+
+    def sync(self, state, fail=False):
+        self.fail = fail
+        client = MagicMock()
+        client.get_locations.return_value = iter([([{'id': 'location_1'}, {'id': 'location_2'}, {'id': 'location_3'}], None)])
+        client.get_payments.side_effect = self.get_payments
+        output = FakeOutput()
+        stream = Payments(client, self.config, output)
+        try:
+            state = stream.sync(state, {}, {}, self.config, FakeTransformer())
+        except RuntimeError:
+            pass
+        return output, state
+
+    def test_failed_run_resumes_from_its_progress(self):
+        state = {}
+        output, state = self.sync(state, fail=True)
+        self.assertEqual(['location_1-None', 'location_2-None', 'location_2-page_2'], [record['id'] for record in output.records])
+        progress = state['bookmarks']['payments']
+        self.assertEqual(['location_1', 'location_2'], progress['completed_location_ids'])
+        self.assertEqual('2023-01-04T00:00:00.000Z', progress['max_updated_at'])
+        sync_end = progress['sync_end']
+
+        self.calls = []
+        output, state = self.sync(state)
+        self.assertEqual(['location_3-None'], [record['id'] for record in output.records])
+        # The resumed run repeats the failed run's request for the remaining location
+        self.assertEqual([('location_3', None, sync_end)], self.calls)
+        self.assertEqual({'updated_at': '2023-01-04T00:00:00.000Z'}, state['bookmarks']['payments'])
+
+    def test_location_in_progress_resumes_from_its_cursor(self):
+        state = {'bookmarks': {'payments': {
+            'updated_at': '2023-01-01T00:00:00Z',
+            'sync_end': '2023-02-01T00:00:00Z',
+            'completed_location_ids': ['location_1'],
+            'location_id': 'location_2',
+            'slice_begin_time': '2023-01-01T00:00:00Z',
+            'cursor': 'page_2',
+        }}}
+        output, state = self.sync(state)
+        self.assertEqual(['location_2-page_2', 'location_3-None'], [record['id'] for record in output.records])
+        self.assertEqual('2023-01-04T00:00:00.000Z', state['bookmarks']['payments']['updated_at'])
+
+
+class TestPaymentsTimeSlices(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            'start_date': '2023-01-01T00:00:00Z',
+            'location_concurrency': 3,
+            'payments_time_slice_days': 10,
+        }
+        self.calls = []
+        self.fail_at = None
+
+    def get_payments(self, location_id, start_time, bookmarked_cursor, end_time):
+        self.calls.append((location_id, start_time, bookmarked_cursor))
+        if (location_id, start_time) == self.fail_at:
+            raise RuntimeError('boom')
+        yield [{'id': '{}-{}'.format(location_id, start_time), 'updated_at': start_time}], None
+
+    def sync(self, state):
+        client = MagicMock()
+        client.get_locations.return_value = iter([([{'id': 'location_1'}, {'id': 'location_2'}], None)])
+        client.get_payments.side_effect = self.get_payments
+        output = FakeOutput()
+        try:
+            state = Payments(client, self.config, output).sync(state, {}, {}, self.config, FakeTransformer())
+        except RuntimeError:
+            pass
+        return output, state
+
+    def test_time_slices(self):
+        self.assertEqual(
+            [('2023-01-01T00:00:00Z', '2023-01-11T00:00:00.000000Z'),
+             ('2023-01-11T00:00:00.000000Z', '2023-01-21T00:00:00.000000Z'),
+             ('2023-01-21T00:00:00.000000Z', '2023-01-25T00:00:00Z')],
+            get_time_slices('2023-01-01T00:00:00Z', '2023-01-25T00:00:00Z', 10))
+        self.assertEqual([('a', 'b')], get_time_slices('a', 'b'))
+
+    def test_slices_resume_after_the_last_completed_slice(self):
+        state = {'bookmarks': {'payments': {'sync_end': '2023-01-25T00:00:00Z'}}}
+        self.fail_at = ('location_2', '2023-01-11T00:00:00.000000Z')
+        output, state = self.sync(state)
+
+        self.assertEqual(
+            ['location_1-2023-01-01T00:00:00Z', 'location_1-2023-01-11T00:00:00.000000Z',
+             'location_1-2023-01-21T00:00:00.000000Z', 'location_2-2023-01-01T00:00:00Z'],
+            [record['id'] for record in output.records])
+        progress = state['bookmarks']['payments']
+        self.assertEqual(['location_1'], progress['completed_location_ids'])
+        self.assertEqual(('location_2', '2023-01-11T00:00:00.000000Z'), (progress['location_id'], progress['slice_begin_time']))
+        self.assertNotIn('cursor', progress)
+
+        self.fail_at = None
+        self.calls = []
+        output, state = self.sync(state)
+        self.assertEqual(
+            [('location_2', '2023-01-11T00:00:00.000000Z', None), ('location_2', '2023-01-21T00:00:00.000000Z', None)],
+            self.calls)
+        self.assertEqual({'updated_at': '2023-01-21T00:00:00.000000Z'}, state['bookmarks']['payments'])
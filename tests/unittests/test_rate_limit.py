@@ -0,0 +1,61 @@
+import unittest
+
+from tap_square.rate_limit import RateLimiter, get_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(max_rate=4, min_rate=1, clock=self.clock)
+
+    def test_requests_are_spaced_at_the_rate(self):
+        waits = [self.limiter.reserve() for _ in range(6)]
+        # The first request uses the initial token and the rest queue up a quarter second apart
+        self.assertEqual([0.0, 0.25, 0.5, 0.75, 1.0, 1.25], waits)
+
+    def test_tokens_refill_over_time(self):
+        for _ in range(4):
+            self.limiter.reserve()
+        self.clock.now += 10
+        self.assertEqual(0.0, self.limiter.reserve())
+
+    def test_throttle_halves_the_rate_and_success_recovers_it(self):
+        self.limiter.on_throttle()
+        self.assertEqual(2.0, self.limiter.rate)
+        self.limiter.on_throttle()
+        self.limiter.on_throttle()
+        self.assertEqual(1.0, self.limiter.rate)
+
+        for _ in range(100):
+            self.limiter.on_success()
+        self.assertEqual(4.0, self.limiter.rate)
+
+    def test_retry_after_blocks_requests(self):
+        self.limiter.on_throttle(retry_after=30)
+        self.assertEqual(30.0, self.limiter.reserve())
+        self.clock.now += 31
+        self.assertEqual(0.0, self.limiter.reserve())
+
+
+class TestGetRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(12.0, get_retry_after({'Retry-After': '12'}))
+
+    def test_header_name_is_case_insensitive(self):
+        self.assertEqual(3.0, get_retry_after({'retry-after': '3'}))
+
+    def test_http_date_in_the_past(self):
+        self.assertEqual(0.0, get_retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}))
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(get_retry_after({}))
+        self.assertIsNone(get_retry_after(None))
+        self.assertIsNone(get_retry_after({'Retry-After': 'soon'}))
@@ -109,7 +109,11 @@ class TestGetAccessToken(unittest.TestCase):
         mock_client_instance = mock_client.return_value
         mock_client_instance.o_auth.obtain_token.return_value = MagicMock(
             is_error=MagicMock(return_value=False),
-            body={'access_token': 'new_token', 'refresh_token': 'new_refresh_token'},
+            body={
+                'access_token': 'new_token',
+                'refresh_token': 'new_refresh_token',
+                'expires_at': '2025-02-20T00:00:00Z',
+            },
         )
 
         _instance = SquareClient(self.config, self.config_path)
@@ -125,7 +129,11 @@ class TestGetAccessToken(unittest.TestCase):
                 'access_token': 'cached_token',
             },
             '/path/to/config.json',
-            {'access_token': 'new_token', 'refresh_token': 'new_refresh_token'},
+            {
+                'access_token': 'new_token',
+                'refresh_token': 'new_refresh_token',
+                'access_token_expires_at': '2025-02-20T00:00:00Z',
+            },
         )
         mock_client_instance.o_auth.obtain_token.assert_called_once()
 
@@ -152,3 +160,36 @@ class TestGetAccessToken(unittest.TestCase):
 
         self.assertIn('Invalid credentials', str(context.exception))
         mock_client_instance.o_auth.obtain_token.assert_called_once()
+
+    @patch('tap_square.client.Client')
+    @patch('tap_square.client.require_new_access_token')
+    def test_get_access_token_cached_expiry(self, mock_require_new_access_token, mock_client):
+        '''
+        Test the case where the config has an expiry outside the refresh window, no request is made
+        '''
+        self.config['access_token_expires_at'] = utils.strftime(utils.now() + timedelta(days=26))
+
+        _instance = SquareClient(self.config, self.config_path)
+
+        self.assertEqual(_instance._access_token, 'cached_token')
+        mock_require_new_access_token.assert_not_called()
+        mock_client.return_value.o_auth.retrieve_token_status.assert_not_called()
+        # Only the client used for syncing is constructed
+        mock_client.assert_called_once_with(access_token='cached_token', environment='production')
+
+    @patch('tap_square.client.Client')
+    @patch('tap_square.client.require_new_access_token')
+    @patch('tap_square.client.write_config')
+    @patch('singer.http_request_timer')
+    def test_get_access_token_cached_expiry_inside_refresh_window(
+        self, mock_http_timer, mock_write_config, mock_require_new_access_token, mock_client
+    ):
+        '''
+        Test the case where the cached expiry is inside the refresh window, the token status is checked
+        '''
+        self.config['access_token_expires_at'] = utils.strftime(utils.now() + timedelta(days=10))
+        mock_require_new_access_token.return_value = False
+
+        SquareClient(self.config, self.config_path)
+
+        mock_require_new_access_token.assert_called_once()
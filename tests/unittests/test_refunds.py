@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_square.streams import Refunds
+from fakes import FakeOutput, FakeTransformer
+
+
+class TestRefunds(unittest.TestCase):
+    def sync(self, config):
+        config = dict(config, start_date='2023-01-01T00:00:00Z')
+        state = {'bookmarks': {'refunds': {'created_at': '2023-02-10T00:00:00Z'}}}
+        client = MagicMock()
+        client.get_refunds.return_value = iter([
+            ([{'id': 'a', 'created_at': '2023-02-10T00:00:00Z'}, {'id': 'b', 'created_at': '2023-02-11T00:00:00Z'}], 'next'),
+            ([{'id': 'c', 'created_at': '2023-02-12T00:00:00Z'}], None),
+        ])
+        output = FakeOutput()
+        state = Refunds(client, config, output).sync(state, {}, {}, config, FakeTransformer())
+        return client, output, state
+
+    def test_refunds_are_read_from_the_bookmark_with_a_checkpoint_per_page(self):
+        client, output, state = self.sync({'refunds_lookback_days': 0})
+
+        client.get_refunds.assert_called_once_with('2023-02-10T00:00:00.000000Z', None, 'ASC')
+        self.assertEqual(['2023-02-11T00:00:00Z', '2023-02-12T00:00:00Z'], output.get_checkpointed('refunds', 'created_at'))
+        self.assertEqual({'created_at': '2023-02-12T00:00:00Z'}, state['bookmarks']['refunds'])
+
+    def test_lookback_stops_at_the_start_date(self):
+        client, _, _ = self.sync({'refunds_lookback_days': 7})
+        self.assertEqual('2023-02-03T00:00:00.000000Z', client.get_refunds.call_args.args[0])
+
+        client, _, _ = self.sync({'refunds_lookback_days': 365})
+        self.assertEqual('2023-01-01T00:00:00.000000Z', client.get_refunds.call_args.args[0])
+
+    def test_refunds_created_before_the_bookmark_are_read_again_by_default(self):
+        refunds = [
+            # Pending when the bookmark passed it, completed since
+            {'id': 'settled', 'status': 'COMPLETED', 'created_at': '2023-02-01T00:00:00Z'},
+            {'id': 'new', 'status': 'PENDING', 'created_at': '2023-02-11T00:00:00Z'},
+        ]
+        config = {'start_date': '2023-01-01T00:00:00Z'}
+        state = {'bookmarks': {'refunds': {'created_at': '2023-02-10T00:00:00Z'}}}
+        client = MagicMock()
+        client.get_refunds.side_effect = lambda start_time, cursor, sort_order: iter([(
+            [refund for refund in refunds if refund['created_at'] >= start_time[:10]], None)])
+        output = FakeOutput()
+
+        state = Refunds(client, config, output).sync(state, {}, {}, config, FakeTransformer())
+
+        self.assertEqual(['settled', 'new'], [record['id'] for record in output.records])
+        self.assertEqual({'created_at': '2023-02-11T00:00:00Z'}, state['bookmarks']['refunds'])
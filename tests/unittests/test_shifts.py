@@ -0,0 +1,47 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_square.streams import Shifts
+from fakes import FakeOutput, FakeTransformer
+
+
+class TestShifts(unittest.TestCase):
+    def test_search_stops_at_the_first_shift_older_than_the_bookmark(self):
+        requested_pages = []
+
+        def get_shifts(bookmarked_cursor, sort_order):
+            self.assertEqual('DESC', sort_order)
+            for page_number, updated_ats in enumerate([
+                    ['2023-01-05T00:00:00Z', '2023-01-04T00:00:00Z'],
+                    ['2023-01-03T00:00:00Z', '2023-01-01T00:00:00Z'],
+                    ['2022-12-01T00:00:00Z', '2022-11-01T00:00:00Z']]):
+                requested_pages.append(page_number)
+                yield [{'id': updated_at, 'updated_at': updated_at} for updated_at in updated_ats], 'cursor'
+
+        client = MagicMock()
+        client.get_shifts.side_effect = get_shifts
+        config = {'start_date': '2020-01-01T00:00:00Z'}
+        state = {'bookmarks': {'shifts': {'updated_at': '2023-01-02T00:00:00Z', 'sync_start': '2023-01-06T00:00:00Z'}}}
+        output = FakeOutput()
+
+        state = Shifts(client, config, output).sync(state, {}, {}, config, FakeTransformer())
+
+        self.assertEqual(
+            ['2023-01-05T00:00:00Z', '2023-01-04T00:00:00Z', '2023-01-03T00:00:00Z'],
+            [record['id'] for record in output.records])
+        self.assertEqual([0, 1], requested_pages)
+        self.assertEqual({'updated_at': '2023-01-06T00:00:00Z'}, state['bookmarks']['shifts'])
+
+    def sync_from_cursor(self, bookmarks):
+        client = MagicMock()
+        client.get_shifts.return_value = iter([([{'id': 'a', 'updated_at': '2023-01-05T00:00:00Z'}], None)])
+        config = {'start_date': '2020-01-01T00:00:00Z'}
+        state = {'bookmarks': {'shifts': dict(bookmarks, sync_start='2023-01-06T00:00:00Z')}}
+        Shifts(client, config, FakeOutput()).sync(state, {}, {}, config, FakeTransformer())
+        return client.get_shifts.call_args.args
+
+    def test_cursor_is_resumed_for_the_same_sort_order(self):
+        self.assertEqual(('next', 'DESC'), self.sync_from_cursor({'cursor': 'next', 'cursor_sort_order': 'DESC'}))
+
+    def test_cursor_from_the_oldest_first_search_is_dropped(self):
+        self.assertEqual((None, 'DESC'), self.sync_from_cursor({'cursor': 'next'}))
@@ -0,0 +1,34 @@
+import unittest
+from unittest.mock import MagicMock
+
+from tap_square.streams import Items, Taxes
+
+
+class TestSkipUnchangedCatalog(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.get_catalog_latest_time.return_value = '2023-01-02T00:00:00.000Z'
+        self.client.get_catalog.return_value = iter([])
+        self.config = {'start_date': '2023-01-01T00:00:00Z', 'skip_unchanged_catalog': True}
+
+    def sync(self, stream_class, bookmark):
+        state = {'bookmarks': {stream_class.tap_stream_id: {'updated_at': bookmark}}}
+        return stream_class(self.client, self.config, MagicMock()).sync(state, {}, {}, self.config, MagicMock())
+
+    def test_unchanged_catalog_is_not_searched(self):
+        self.sync(Items, '2023-01-02T00:00:00.000000Z')
+        self.sync(Taxes, '2023-01-03T00:00:00Z')
+
+        self.client.get_catalog.assert_not_called()
+        # The latest change time is looked up once per client
+        self.client.get_catalog_latest_time.assert_called_once_with()
+
+    def test_changed_catalog_is_searched(self):
+        self.sync(Items, '2023-01-01T00:00:00Z')
+        self.client.get_catalog.assert_called_once_with('ITEM', '2023-01-01T00:00:00Z')
+
+    def test_disabled_by_default(self):
+        del self.config['skip_unchanged_catalog']
+        self.sync(Items, '2023-01-03T00:00:00Z')
+        self.client.get_catalog.assert_called_once()
+        self.client.get_catalog_latest_time.assert_not_called()
@@ -1,9 +1,12 @@
+import os
+import tempfile
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from singer import Transformer
 
 from tap_square.client import SquareClient
 from tap_square.streams import TeamMembers
+from fakes import FakeOutput
 
 
 mock_config = {
@@ -125,3 +128,45 @@ class TestTeamMembers(unittest.TestCase):
         )
 
         self.assertEqual(expected_return_value, return_value)
+
+
+class TestTeamMembersFiltering(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.team_members = [
+            {'id': 'b', 'updated_at': '2023-07-13T00:00:00Z'},
+            {'id': 'a', 'updated_at': '2023-07-12T00:00:00Z'},
+            {'id': 'old', 'updated_at': '2023-07-01T00:00:00Z'},
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def sync(self, state, config):
+        client = MagicMock()
+        client.get_locations.return_value = iter(mock_response_location_ids)
+        client.get_team_members.return_value = iter([(self.team_members, None)])
+        output = FakeOutput()
+        transformer = MagicMock()
+        transformer.transform.side_effect = lambda record, schema, metadata: record
+        state = TeamMembers(client, config, output).sync(state, stream_schema, stream_metadata, config, transformer)
+        return output, transformer, state
+
+    def test_records_after_the_bookmark_are_emitted_in_any_order(self):
+        output, transformer, state = self.sync({}, mock_config)
+
+        self.assertEqual(['b', 'a'], [record['id'] for record in output.records])
+        # Records older than the bookmark aren't transformed
+        self.assertEqual(2, transformer.transform.call_count)
+        self.assertEqual('2023-07-13T00:00:00Z', state['bookmarks']['team_members']['updated_at'])
+
+    def test_digest_skips_unchanged_team_members(self):
+        config = dict(mock_config, team_members_digest_path=os.path.join(self.directory.name, 'digest.db'))
+        _, _, state = self.sync({}, config)
+
+        self.team_members[1] = {'id': 'a', 'updated_at': '2023-07-14T00:00:00Z'}
+        output, _, state = self.sync(state, config)
+
+        # `b` is at the bookmark but hasn't changed since it was synced
+        self.assertEqual(['a'], [record['id'] for record in output.records])
+        self.assertEqual('2023-07-14T00:00:00Z', state['bookmarks']['team_members']['updated_at'])
@@ -0,0 +1,144 @@
+import copy
+import json
+import random
+import unittest
+
+from singer import Transformer, metadata
+from singer.transform import SchemaMismatch
+
+from tap_square.discover import get_schemas
+from tap_square.transform import CompiledTransformer, transform_datetime
+
+RECORDS_PER_STREAM = 100
+
+DATETIME_VALUES = [
+    '2023-07-11T13:58:15.123Z',
+    '2023-07-11T13:58:15Z',
+    '2023-07-11T13:58:15.123456Z',
+    '2023-07-11T13:58:15+05:30',
+    '2023-07-11',
+    '2023-02-30T00:00:00Z',
+    'not a date',
+    '',
+    None,
+    1689083895,
+]
+
+
+class RecordGenerator():
+    '''
+    Generates records loosely following a schema, with a share of values of
+    the wrong type, unknown fields and nulls to exercise every transform path
+    '''
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+
+    def value(self, schema, depth=0):
+        if 'anyOf' in schema:
+            return self.value(self.random.choice(schema['anyOf']), depth)
+        if 'type' not in schema:
+            return {'untyped': self.random.randint(0, 9)}
+
+        types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+        if self.random.random() < 0.01:
+            return self.random.choice([None, '', 'text', 12, 1.5, True, '1,234', 'false', {'a': 1}, ['a']])
+
+        typ = self.random.choice(types)
+        if typ == 'null':
+            return None
+        if schema.get('format') == 'date-time':
+            return self.random.choice(DATETIME_VALUES)
+        if typ == 'object':
+            return self.object(schema.get('properties', {}), depth)
+        if typ == 'array':
+            return [self.value(schema['items'], depth + 1) for _ in range(self.random.randint(0, 3))]
+        if typ == 'string':
+            return self.random.choice(['text', 'Ünïcode', '', 'x' * 20, 42])
+        if typ == 'integer':
+            return self.random.choice([0, 7, -3, 2**40, '12', '1,000', 3.0, True])
+        if typ == 'number':
+            return self.random.choice([0, 1.25, -3, '2.5', '1,000.5'])
+        if typ == 'boolean':
+            return self.random.choice([True, False, 'false', 'FALSE', 'true', 0, 1])
+        return 'unexpected'
+
+    def object(self, properties, depth):
+        record = {}
+        for key, subschema in properties.items():
+            if depth > 4 or self.random.random() < 0.3:
+                continue
+            record[key] = self.value(subschema, depth + 1)
+        if self.random.random() < 0.2:
+            record['not_in_schema'] = 'dropped'
+        return record
+
+
+def transform_or_error(transformer, record, schema, stream_metadata):
+    try:
+        return json.dumps(transformer.transform(copy.deepcopy(record), schema, stream_metadata), sort_keys=True)
+    except SchemaMismatch:
+        return SchemaMismatch
+
+
+class TestCompiledTransformerEquivalence(unittest.TestCase):
+    def assert_equivalent(self, stream_name, schema, stream_metadata, seed):
+        generator = RecordGenerator(seed)
+        # The Transformer reorders type lists in place, so it gets its own copy
+        transformer_schema = copy.deepcopy(schema)
+        with CompiledTransformer() as compiled:
+            for _ in range(RECORDS_PER_STREAM):
+                record = generator.object(schema['properties'], 0)
+                expected = transform_or_error(Transformer(), record, transformer_schema, stream_metadata)
+                actual = transform_or_error(compiled, record, schema, stream_metadata)
+                self.assertEqual(expected, actual, '{}: {}'.format(stream_name, record))
+
+    def test_all_schemas_with_all_fields_selected(self):
+        schemas, schemas_metadata = get_schemas(sandbox=False)
+        for stream_name, schema in schemas.items():
+            stream_metadata = metadata.to_map(schemas_metadata[stream_name])
+            self.assert_equivalent(stream_name, schema, stream_metadata, stream_name)
+
+    def test_all_schemas_with_deselected_fields(self):
+        schemas, schemas_metadata = get_schemas(sandbox=False)
+        for stream_name, schema in schemas.items():
+            stream_metadata = metadata.to_map(schemas_metadata[stream_name])
+            rng = random.Random(stream_name)
+            for breadcrumb in list(stream_metadata):
+                if breadcrumb and rng.random() < 0.3:
+                    stream_metadata = metadata.write(stream_metadata, breadcrumb, 'selected', False)
+            stream_metadata = metadata.write(stream_metadata, ('properties', 'not_in_schema'), 'inclusion', 'unsupported')
+            self.assert_equivalent(stream_name, schema, stream_metadata, stream_name + '-deselected')
+
+    def test_without_metadata(self):
+        schemas, _ = get_schemas(sandbox=False)
+        self.assert_equivalent('orders', schemas['orders'], None, 'orders-no-metadata')
+
+    def test_nested_deselected_fields(self):
+        schema = {
+            'type': 'object',
+            'properties': {
+                'id': {'type': ['null', 'string']},
+                'nested': {
+                    'type': ['null', 'object'],
+                    'properties': {
+                        'keep': {'type': ['null', 'integer']},
+                        'drop': {'type': ['null', 'integer']},
+                    },
+                },
+                'untyped': {},
+            },
+        }
+        stream_metadata = {
+            (): {'selected': True},
+            ('properties', 'nested', 'properties', 'drop'): {'selected': False},
+        }
+        record = {'id': 1, 'nested': {'keep': '1,000', 'drop': 2}, 'untyped': {'a': 1}}
+        with CompiledTransformer() as compiled:
+            self.assertEqual(
+                Transformer().transform(copy.deepcopy(record), copy.deepcopy(schema), stream_metadata),
+                compiled.transform(record, schema, stream_metadata),
+            )
+
+    def test_square_timestamps_match_dateutil_parsing(self):
+        for value in DATETIME_VALUES[:6] + ['0001-01-01T00:00:00Z', '2020-12-31T23:59:59.9Z']:
+            self.assertEqual(Transformer()._transform_datetime(value), transform_datetime(value))
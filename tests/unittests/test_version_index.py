@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from tap_square.version_index import VersionIndex
+
+
+class TestVersionIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'index.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_only_changed_versions_are_returned(self):
+        with VersionIndex(self.path, 'orders') as index:
+            index.stage([('a', 1), ('b', 2)])
+            index.commit()
+            self.assertEqual(['b', 'c'], index.get_changed([('a', 1), ('b', 3), ('c', 1)]))
+
+    def test_objects_without_a_version_are_always_changed(self):
+        with VersionIndex(self.path, 'orders') as index:
+            index.stage([('a', None)])
+            index.commit()
+            self.assertEqual(['a'], index.get_changed([('a', None)]))
+
+    def test_staged_versions_are_dropped_without_a_commit(self):
+        with VersionIndex(self.path, 'orders') as index:
+            index.stage([('a', 1)])
+            index.commit()
+            index.stage([('a', 2)])
+
+        with VersionIndex(self.path, 'orders') as index:
+            self.assertEqual(['a'], index.get_changed([('a', 2)]))
+            index.commit()
+            self.assertEqual(['a'], index.get_changed([('a', 2)]))
+
+    def test_indexes_are_kept_apart_by_name(self):
+        with VersionIndex(self.path, 'orders') as index:
+            index.stage([('a', 1)])
+            index.commit()
+        with VersionIndex(self.path, 'team_members') as index:
+            self.assertEqual(['a'], index.get_changed([('a', 1)]))